@@ -4,46 +4,54 @@
     instead.
 """
 
-import os
 import dash
 import dash_html_components as html
 import dash_core_components as dcc
-from dash.dependencies import Input, Output, State
-from keras.models import load_model
-from constant import MODEL_NAME
-from network.clustering import ClusteringLayer
+from dash.dependencies import Input, Output, State, ALL, MATCH
+from dash.exceptions import PreventUpdate
+from network.registry import get_model
+from network.registry import model_version
 import components.layout as layout
-from sample import Sample
-from components.luacode import LuaCode
-from components.seesoft import SeeSoft
-from components.scatterplot import ScatterPlot
 from components.tree import Tree
-from components.clusters import Clusters
-from components.prediction import Prediction
-from components.network import Network
-import time
+from components.clusters import get_clusters
+from components.clusters import TRAIN_SAMPLES_NUM
+from network.neighbours import NearestNeighbours
+from session import create_store
+from session import new_session_id
+from analysis import SampleAnalysis
+from analysis import get_analysis
+from jobs import JobQueue
+from jobs import JOB_POLL_INTERVAL
+from jobs import cluster_job
+from jobs import network_job
+from jobs import comparison_job
+import copy
+import os
+
 
+# worker processes for the slow figures are started before the NN model is
+# loaded, so they don't inherit the initialized model
+job_queue = JobQueue()
+job_queue.start()
 
-here = os.path.dirname(os.path.realpath(__file__))
-model_path = '{}/network/{}'.format(here, MODEL_NAME)
-model = load_model(model_path,
-                   custom_objects={'ClusteringLayer': ClusteringLayer})
+# load the NN model before the first request, the same model instance is
+# then shared by all samples
+get_model()
 
-# global variables for visualization components
-luacode = None
-seesoft = None
-scatterplot = None
-tree = None
-sample = None
-# counter for the main SUBMIT button
-click_counter = 0
-clusters = Clusters()
-prediction = None
+# train data of the cluster diagram and the nearest neighbours index are
+# shared by all sessions, the train data are loaded again when the model is
+# reloaded
+get_clusters()
+neighbours = NearestNeighbours()
+# state of the analyzed sample (path of the analyzed sample, expanded nodes
+# of AST, click counter and clusters state) is kept separately for each
+# session, the analysis itself is shared by get_analysis
+session_store = create_store()
 
 
 app = dash.Dash(__name__)
 
-app.layout = html.Div([
+main_layout = html.Div([
     # title
     html.Div([
         html.H3(
@@ -80,6 +88,31 @@ app.layout = html.Div([
     html.Div(id='sample-name-hidden-div',
              children='',
              style={'display': 'none'}),
+    # rendered range of lines of large LuaCode and the line which shall be
+    # rendered after scrolling out of the range
+    dcc.Store(id='luacode-window'),
+    dcc.Store(id='luacode-scroll'),
+    dcc.Interval(id='luacode-interval', interval=500),
+    # small token changed with every update of the AST, so the callbacks can
+    # be chained after it without sending the whole figure to the server
+    dcc.Store(id='tree-version'),
+    # ids of the background jobs computing the slow figures, the jobs are
+    # polled only while they are running
+    dcc.Store(id='clusters-job'),
+    dcc.Interval(id='clusters-interval', interval=JOB_POLL_INTERVAL,
+                 disabled=True),
+    dcc.Store(id='network-job'),
+    dcc.Interval(id='network-interval', interval=JOB_POLL_INTERVAL,
+                 disabled=True),
+    html.Div([
+        component
+        for i in range(TRAIN_SAMPLES_NUM)
+        for component in (
+            dcc.Store(id={'type': 'train-job', 'index': i}),
+            dcc.Interval(id={'type': 'train-interval', 'index': i},
+                         interval=JOB_POLL_INTERVAL, disabled=True)
+        )
+    ]),
     # heading
     html.Div([
         html.H4('Source code visualization')],
@@ -215,6 +248,23 @@ app.layout = html.Div([
                             'height': '500px',
                         }
                     ),
+                    html.H6('Most similar train samples'),
+                    # train samples with the closest activations
+                    html.Pre(
+                        id='neighbours-content',
+                        children=[],
+                        style={
+                            'font-size': '12px'
+                        }
+                    ),
+                    # button to copy the paths of the most similar train
+                    # samples to the inputs for comparison
+                    html.Button(
+                        id='neighbours-button',
+                        children=['Compare with the most similar samples'],
+                        n_clicks=0,
+                        className='link-button'
+                    ),
                 ],
                 style={
                     'float': 'left',
@@ -274,23 +324,14 @@ app.layout = html.Div([
     html.Div(
         children=[
             html.Div('Analyzed sample', style={'width': '230px',
-                                               'float': 'left',
-                                               'margin': '10px'}),
-            html.Div('Train sample #1', style={'width': '230px',
-                                               'float': 'left',
-                                               'margin': '10px'}),
-            html.Div('Train sample #2', style={'width': '230px',
-                                               'float': 'left',
-                                               'margin': '10px'}),
-            html.Div('Train sample #3', style={'width': '230px',
-                                               'float': 'left',
-                                               'margin': '10px'}),
-            html.Div('Train sample #4', style={'width': '230px',
-                                               'float': 'left',
-                                               'margin': '10px'}),
-            html.Div('Train sample #5', style={'width': '230px',
                                                'float': 'left',
                                                'margin': '10px'})
+        ] + [
+            html.Div('Train sample #{}'.format(i + 1),
+                     style={'width': '230px',
+                            'float': 'left',
+                            'margin': '10px'})
+            for i in range(TRAIN_SAMPLES_NUM)
         ],
         className='row'
     ),
@@ -301,66 +342,24 @@ app.layout = html.Div([
                 [],
                 style={'width': '230px', 'float': 'left',
                        'margin-right': '20px'}
-            ),
-            dcc.Input(
-                id='train1-input',
-                placeholder='Sample #1',
-                style={'width': '185px', 'margin-left': '10px'}
-            ),
-            html.Button(
-                '✓',
-                id='train1-yes-button',
-                n_clicks=0,
-                style={'margin-left': '5px', 'margin-rignt': '10px'},
-                className='yes-button'
-            ),
-            dcc.Input(
-                id='train2-input',
-                placeholder='Sample #2',
-                style={'width': '185px', 'margin-left': '23px'}
-            ),
-            html.Button(
-                '✓',
-                id='train2-yes-button',
-                n_clicks=0,
-                style={'margin-left': '5px', 'margin-rignt': '10px'},
-                className='yes-button'
-            ),
-            dcc.Input(
-                id='train3-input',
-                placeholder='Sample #3',
-                style={'width': '185px', 'margin-left': '22px'}
-            ),
-            html.Button(
-                '✓',
-                id='train3-yes-button',
-                n_clicks=0,
-                style={'margin-left': '5px', 'margin-rignt': '10px'},
-                className='yes-button'
-            ),
-            dcc.Input(
-                id='train4-input',
-                placeholder='Sample #4',
-                style={'width': '185px', 'margin-left': '22px'}
-            ),
-            html.Button(
-                '✓',
-                id='train4-yes-button',
-                n_clicks=0,
-                style={'margin-left': '5px', 'margin-rignt': '10px'},
-                className='yes-button'
-            ),
-            dcc.Input(
-                id='train5-input',
-                placeholder='Sample #5',
-                style={'width': '185px', 'margin-left': '22px'}
-            ),
-            html.Button(
-                '✓',
-                id='train5-yes-button',
-                n_clicks=0,
-                style={'margin-left': '5px'},
-                className='yes-button'
+            )
+        ] + [
+            component
+            for i in range(TRAIN_SAMPLES_NUM)
+            for component in (
+                dcc.Input(
+                    id={'type': 'train-input', 'index': i},
+                    placeholder='Sample #{}'.format(i + 1),
+                    style={'width': '185px',
+                           'margin-left': '10px' if i == 0 else '22px'}
+                ),
+                html.Button(
+                    '✓',
+                    id={'type': 'train-yes-button', 'index': i},
+                    n_clicks=0,
+                    style={'margin-left': '5px'},
+                    className='yes-button'
+                )
             )
         ],
         className='row'
@@ -380,61 +379,10 @@ app.layout = html.Div([
                     'width': '230px',
                     'padding': '10px'
                 }
-            ),
-            dcc.Graph(
-                id='train1-prediction',
-                figure=layout.get_empty_figure(height=100),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'height': '100px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px'
-                }
-            ),
-            dcc.Graph(
-                id='train2-prediction',
-                figure=layout.get_empty_figure(height=100),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'height': '100px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px'
-                }
-            ),
-            dcc.Graph(
-                id='train3-prediction',
-                figure=layout.get_empty_figure(height=100),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'height': '100px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px'
-                }
-            ),
-            dcc.Graph(
-                id='train4-prediction',
-                figure=layout.get_empty_figure(height=100),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'height': '100px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px'
-                }
-            ),
+            )
+        ] + [
             dcc.Graph(
-                id='train5-prediction',
+                id={'type': 'train-prediction', 'index': i},
                 figure=layout.get_empty_figure(height=100),
                 config={
                     'displayModeBar': False
@@ -445,7 +393,8 @@ app.layout = html.Div([
                     'width': '230px',
                     'padding': '10px'
                 }
-            ),
+            )
+            for i in range(TRAIN_SAMPLES_NUM)
         ],
         className='row'
     ),
@@ -464,61 +413,10 @@ app.layout = html.Div([
                     'width': '230px',
                     'padding': '10px',
                 }
-            ),
-            dcc.Graph(
-                id='train1-content',
-                figure=layout.get_empty_figure(height=650),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'max-height': '650px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px',
-                }
-            ),
-            dcc.Graph(
-                id='train2-content',
-                figure=layout.get_empty_figure(height=650),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'max-height': '650px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px',
-                }
-            ),
-            dcc.Graph(
-                id='train3-content',
-                figure=layout.get_empty_figure(height=650),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'max-height': '650px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px',
-                }
-            ),
-            dcc.Graph(
-                id='train4-content',
-                figure=layout.get_empty_figure(height=650),
-                config={
-                    'displayModeBar': False
-                },
-                style={
-                    'max-height': '650px',
-                    'float': 'left',
-                    'width': '230px',
-                    'padding': '10px',
-                }
-            ),
+            )
+        ] + [
             dcc.Graph(
-                id='train5-content',
+                id={'type': 'train-content', 'index': i},
                 figure=layout.get_empty_figure(height=650),
                 config={
                     'displayModeBar': False
@@ -529,7 +427,8 @@ app.layout = html.Div([
                     'width': '230px',
                     'padding': '10px',
                 }
-            ),
+            )
+            for i in range(TRAIN_SAMPLES_NUM)
         ],
         className='row'
     ),
@@ -539,476 +438,437 @@ app.layout = html.Div([
 )
 
 
-# load new sample after submission of new JSON file
-@app.callback(
-    Output('sample-name-hidden-div', 'children'),
-    [Input('module-input-button', 'n_clicks')],
-    [State('module-input', 'value')]
-)
-def load_sample(n_clicks, value):
-    global sample
-    global model
-    global seesoft
-    global prediction
-    global tree
+# every page load gets new session id, so the browser tabs don't share
+# the analyzed sample
+def serve_layout():
+    return html.Div([
+        dcc.Store(id='session-id', data=new_session_id()),
+        main_layout
+    ])
 
-    if n_clicks > 0:
-        seesoft, prediction, tree = None, None, None
-        sample = Sample(path='BP-data/data/' + value, model=model)
-        return n_clicks
 
-    return ''
+app.layout = serve_layout
 
 
-# create new LuaCode visualization for given JSON file
-@app.callback(
-    Output('luacode-div', 'children'),
-    [Input('sample-name-hidden-div', 'children')]
-)
-def update_input_luacode(children):
-    global luacode
-    global sample
+# returns analysis of the sample submitted in the session, the analysis is
+# created again if it's not cached (e.g. by other worker process)
+def session_analysis(session_id: str) -> SampleAnalysis:
+    path = session_store.get(session_id, 'path')
+    # the session expired
+    if not path:
+        raise PreventUpdate
 
-    if children != '':
-        luacode = LuaCode(data=sample.data)
-        return luacode.view(dash_id='luacode-content')
+    return get_analysis(path)
 
-    else:
-        return layout.get_empty_div(750)
 
+# returns AST of the sample submitted in the session, the AST is shared by
+# all sessions, only the expanded nodes belong to the session
+def session_tree(session_id: str) -> Tree:
+    tree = copy.copy(session_analysis(session_id).tree)
+    max_depth, expanded = session_store.get(session_id, 'tree_state',
+                                            (None, set()))
+    tree.max_depth, tree.expanded = max_depth, set(expanded)
 
-# create new SeeSoft visualization for given JSON file
-@app.callback(
-    Output('seesoft-content', 'figure'),
-    [Input('sample-name-hidden-div', 'children')]
-)
-def update_input_seesoft(children):
-    global seesoft
-    global sample
+    return tree
 
-    if children != '':
-        seesoft = SeeSoft(data=sample.data)
-        seesoft.draw()
-        return seesoft.get_figure()
 
-    else:
-        return layout.get_empty_figure(height=750)
+# returns train samples with the closest activations to the sample submitted
+# in the session, the submitted sample itself is excluded
+def session_neighbours(session_id: str) -> list:
+    analysis = session_analysis(session_id)
+    activations = analysis.sample.activations
+    last_layer = list(activations.keys())[-1]
 
+    return neighbours.query(
+        activations[last_layer][0], k=TRAIN_SAMPLES_NUM,
+        exclude=os.path.relpath(analysis.path, 'BP-data/data'))
 
-# create new ScatterPlot visualization for given JSON file
-@app.callback(
-    Output('scatterplot-content', 'figure'),
-    [Input('sample-name-hidden-div', 'children')]
-)
-def update_input_scatterplot(children):
-    global scatterplot
-    global sample
 
-    if children != '':
-        scatterplot = ScatterPlot(data=sample.data)
-        return scatterplot.get_figure(show_legend=True, show_text=True)
+# returns id and status of the background job, the job is submitted (again)
+# by the given function if it's not known to this process of the app, e.g.
+# it was submitted by other worker process
+def job_status(job_id: str or None, submit) -> (str, dict):
+    status = job_queue.status(job_id) if job_id else {'state': 'unknown'}
+    if status['state'] == 'unknown':
+        job_id = submit()
+        status = job_queue.status(job_id)
 
-    else:
-        return layout.get_empty_figure(height=200)
+    return job_id, status
 
 
-# create new AST visualization for given JSON file
-@app.callback(
-    Output('tree-content', 'figure'),
-    [Input('sample-name-hidden-div', 'children')]
-)
-def update_input_tree(children):
-    global tree
-    global sample
+# returns placeholder with the progress of the background job
+def job_placeholder(status: dict, height: int) -> dict:
+    if status['state'] == 'failed':
+        return layout.get_empty_figure(height=height,
+                                       text='Computation failed')
 
-    if children != '':
-        tree = Tree(data=sample.data)
-        return tree.get_figure(horizontal=True)
+    return layout.get_empty_figure(
+        height=height,
+        text='Computing... {:.0f} %'.format(100 * status['progress']))
 
-    else:
-        return layout.get_empty_figure(height=250)
 
+# submits the job placing the sample analyzed in the session among the train
+# data in the cluster diagram
+def submit_cluster_job(session_id: str) -> str:
+    analysis = session_analysis(session_id)
+    return job_queue.submit(('clusters', ) + analysis.key, cluster_job,
+                            analysis.sample)
 
-# create new cluster diagram for given JSON file or update current diagram
-# (highlight specific train sample or switch between PCA and t-SNE)
-@app.callback(
-    Output('clusters-content', 'figure'),
-    [Input('sample-name-hidden-div', 'children'),
-     Input('cluster-radio', 'value'),
-     Input('train1-yes-button', 'n_clicks'),
-     Input('train2-yes-button', 'n_clicks'),
-     Input('train3-yes-button', 'n_clicks'),
-     Input('train4-yes-button', 'n_clicks'),
-     Input('train5-yes-button', 'n_clicks')],
-    [State('train1-input', 'value'),
-     State('train2-input', 'value'),
-     State('train3-input', 'value'),
-     State('train4-input', 'value'),
-     State('train5-input', 'value')]
-)
-def update_clusters(children, value1, n_clicks2, n_clicks3, n_clicks4,
-                    n_clicks5, n_clicks6, value2, value3, value4, value5,
-                    value6):
-    global click_counter
-    global sample
-    global clusters
 
-    if children != '':
-        # handle train1 sample highlight
-        if n_clicks2 > 0:
-            if value2 == '':
-                clusters.train_samples[0] = None
-            else:
-                clusters.train_samples[0] = value2
-
-        # handle train2 sample highlight
-        if n_clicks3 > 0:
-            if value3 == '':
-                clusters.train_samples[1] = None
-            else:
-                clusters.train_samples[1] = value3
-
-        # handle train3 sample highlight
-        if n_clicks4 > 0:
-            if value4 == '':
-                clusters.train_samples[2] = None
-            else:
-                clusters.train_samples[2] = value4
-
-        # handle train4 sample highlight
-        if n_clicks5 > 0:
-            if value5 == '':
-                clusters.train_samples[3] = None
-            else:
-                clusters.train_samples[3] = value5
-
-        # handle train5 sample highlight
-        if n_clicks6 > 0:
-            if value6 == '':
-                clusters.train_samples[4] = None
-            else:
-                clusters.train_samples[4] = value6
-
-        # click counter used so that the cluster diagram is only updated when
-        # the new JSON file is chosen
-        if int(children) == click_counter:
-            return clusters.get_figure(algorithm=value1)
-
-        click_counter = int(children)
-
-        clusters.add_sample(sample)
-        return clusters.get_figure(algorithm=value1)
+# submits the job visualizing the activations of the sample analyzed in
+# the session
+def submit_network_job(session_id: str) -> str:
+    analysis = session_analysis(session_id)
+    return job_queue.submit(('network', ) + analysis.key, network_job,
+                            analysis.sample)
 
-    else:
-        return layout.get_empty_figure(height=500)
 
+# submits the job analyzing the compared train sample
+def submit_comparison_job(path: str, content: str) -> str:
+    key = ('comparison', os.path.realpath(path), os.path.getmtime(path),
+           model_version(), content)
+    return job_queue.submit(key, comparison_job, path, content)
 
-# create new Prediction visualization for given JSON file
+
+# load new sample after submission of new JSON file
+# the sample is analyzed just once, other callbacks only create figures from
+# the analysis
 @app.callback(
-    Output('prediction-content', 'figure'),
-    [Input('sample-name-hidden-div', 'children')]
+    Output('sample-name-hidden-div', 'children'),
+    [Input('module-input-button', 'n_clicks')],
+    [State('module-input', 'value'),
+     State('session-id', 'data')]
 )
-def update_input_prediction(children):
-    global prediction
-    global sample
-
-    if children != '':
-        prediction = Prediction(sample=sample)
-        return prediction.get_figure()
+def load_sample(n_clicks, value, session_id):
+    if n_clicks > 0:
+        analysis = get_analysis('BP-data/data/' + value)
+        session_store.set(session_id, 'path', analysis.path)
+        session_store.set(session_id, 'tree_state', (None, set()))
+        return n_clicks
 
-    else:
-        return layout.get_empty_figure(height=120)
+    return ''
 
 
-# for the sample comparison create the same Prediction visualization for
-# given JSON file as was used in the upper part
+# create new LuaCode visualization for given JSON file
+# large files are rendered only partially, the rendered lines are changed
+# when the LuaCode is scrolled out of them
 @app.callback(
-    Output('sample-prediction', 'figure'),
-    [Input('sample-name-hidden-div', 'children')]
+    [Output('luacode-div', 'children'),
+     Output('luacode-window', 'data')],
+    [Input('sample-name-hidden-div', 'children'),
+     Input('luacode-scroll', 'data')],
+    [State('session-id', 'data')]
 )
-def update_sample_prediction(children):
-    global prediction
-
+def update_input_luacode(children, line, session_id):
     if children != '':
-        while not prediction:
-            time.sleep(0.5)
+        luacode = session_analysis(session_id).luacode
 
-        return prediction.get_figure(small=True)
+        # new sample is rendered from the beginning
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        if line is None or 'sample-name-hidden-div.children' in triggered:
+            line = 0
+
+        first_line, last_line = luacode.window(line)
+        window = {'first': first_line, 'last': last_line,
+                  'lines': luacode.lines_count()}
+
+        return luacode.view(dash_id='luacode-content', line=line), window
 
     else:
-        return layout.get_empty_figure(height=100)
+        return layout.get_empty_div(750), None
 
 
-# for the sample comparison create the same SeeSoft or AST visualization as was
-# used in the upper part
+# create new SeeSoft visualization for given JSON file
 @app.callback(
-    Output('sample-content', 'figure'),
-    [Input('sample-name-hidden-div', 'children'),
-     Input('compare-radio', 'value')]
+    Output('seesoft-content', 'figure'),
+    [Input('sample-name-hidden-div', 'children')],
+    [State('session-id', 'data')]
 )
-def update_sample_content(children, value):
-    global seesoft
-    global tree
-
+def update_input_seesoft(children, session_id):
     if children != '':
-        if value == 'code':
-            while not seesoft:
-                time.sleep(0.5)
-            return seesoft.get_figure(small=True)
-
-        else:
-            while not tree:
-                time.sleep(0.5)
-            return tree.get_figure()
+        return session_analysis(session_id).seesoft_figure()
 
     else:
-        return layout.get_empty_figure(height=650)
+        return layout.get_empty_figure(height=750)
 
 
-# update Prediction visualization for train sample no. 1
+# create new ScatterPlot visualization for given JSON file
 @app.callback(
-    Output('train1-prediction', 'figure'),
-    [Input('train1-yes-button', 'n_clicks')],
-    [State('train1-input', 'value')]
+    Output('scatterplot-content', 'figure'),
+    [Input('sample-name-hidden-div', 'children')],
+    [State('session-id', 'data')]
 )
-def update_train1_prediction(n_clicks, value):
-    global model
-    if value == '':
-        return layout.get_empty_figure(height=100)
-
-    if n_clicks > 0:
-        local_sample = Sample(path='BP-data/data/' + value, model=model)
-        local_prediction = Prediction(sample=local_sample)
-        return local_prediction.get_figure(small=True)
+def update_input_scatterplot(children, session_id):
+    if children != '':
+        scatterplot = session_analysis(session_id).scatterplot
+        return scatterplot.get_figure(show_legend=True, show_text=True)
 
     else:
-        return layout.get_empty_figure(height=100)
+        return layout.get_empty_figure(height=200)
 
 
-# update SeeSoft or Prediction visualization for train sample no. 1
+# create new AST visualization for given JSON file or expand the aggregated
+# node of the current AST after click on it
 @app.callback(
-    Output('train1-content', 'figure'),
-    [Input('train1-yes-button', 'n_clicks'),
-     Input('compare-radio', 'value')],
-    [State('train1-input', 'value')]
+    [Output('tree-content', 'figure'),
+     Output('tree-version', 'data')],
+    [Input('sample-name-hidden-div', 'children'),
+     Input('tree-content', 'clickData')],
+    [State('session-id', 'data')]
 )
-def update_train1_content(n_clicks, value1, value2):
-    if value2 == '':
-        return layout.get_empty_figure(height=650)
+def update_input_tree(children, click_data, session_id):
+    if children != '':
+        tree = session_tree(session_id)
 
-    if n_clicks > 0:
-        if value1 == 'code':
-            local_seesoft = SeeSoft(path='BP-data/data/' + value2,
-                                    comments=True)
-            local_seesoft.draw()
-            return local_seesoft.get_figure(small=True)
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        if 'tree-content.clickData' in triggered:
+            node = click_data['points'][0].get('customdata')
+            if node is None or not tree.expand(node):
+                raise PreventUpdate
 
-        else:
-            local_tree = Tree(path='BP-data/data/' + value2)
-            return local_tree.get_figure()
+        figure = tree.get_figure(horizontal=True)
+        session_store.set(session_id, 'tree_state',
+                          (tree.max_depth, tree.expanded))
+        version = {'sample': children, 'expanded': len(tree.expanded)}
+        return figure, version
 
     else:
-        return layout.get_empty_figure(height=650)
+        return layout.get_empty_figure(height=250), None
 
 
-# update Prediction visualization for train sample no. 2
+# create new cluster diagram for given JSON file or update current diagram
+# (highlight specific train sample or switch between PCA and t-SNE)
+# the analyzed sample is placed among the train data by the background job,
+# which is polled until it's finished
 @app.callback(
-    Output('train2-prediction', 'figure'),
-    [Input('train2-yes-button', 'n_clicks')],
-    [State('train2-input', 'value')]
+    [Output('clusters-content', 'figure'),
+     Output('clusters-job', 'data')],
+    [Input('sample-name-hidden-div', 'children'),
+     Input('cluster-radio', 'value'),
+     Input({'type': 'train-yes-button', 'index': ALL}, 'n_clicks'),
+     Input('clusters-interval', 'n_intervals')],
+    [State({'type': 'train-input', 'index': ALL}, 'value'),
+     State('clusters-job', 'data'),
+     State('session-id', 'data')]
 )
-def update_train2_prediction(n_clicks, value):
-    global model
-    if value == '':
-        return layout.get_empty_figure(height=100)
-
-    if n_clicks > 0:
-        local_sample = Sample(path='BP-data/data/' + value, model=model)
-        local_prediction = Prediction(sample=local_sample)
-        return local_prediction.get_figure(small=True)
+def update_clusters(children, value, n_clicks, n_intervals, train_values,
+                    job_id, session_id):
+    if children != '':
+        # train data are shared, only the analyzed sample and highlighted
+        # train samples belong to the session
+        session_clusters = copy.copy(get_clusters())
+        session_clusters.set_state(session_store.get(session_id, 'clusters'))
+
+        # handle highlights of the submitted train samples
+        for i, (clicks, train_value) in enumerate(zip(n_clicks,
+                                                      train_values)):
+            if clicks > 0:
+                session_clusters.train_samples[i] = train_value or None
+
+        # click counter used so that the sample is placed among the train
+        # data only when the new JSON file is chosen
+        click_counter = session_store.get(session_id, 'click_counter', 0)
+        if int(children) != click_counter:
+            session_store.set(session_id, 'click_counter', int(children))
+            # the placed sample belongs to the previous JSON file, only
+            # the highlights are kept
+            train_samples = session_clusters.train_samples
+            session_clusters.set_state(None)
+            session_clusters.train_samples = train_samples
+            job_id = submit_cluster_job(session_id)
+
+        if job_id:
+            job_id, status = job_status(
+                job_id, lambda: submit_cluster_job(session_id))
+            if status['state'] == 'done':
+                # result of the job is shared by all sessions polling it
+                state = dict(status['result'])
+                state['train_samples'] = session_clusters.train_samples
+                session_clusters.set_state(state)
+
+        # the sample isn't placed until the job succeeds, the placeholder
+        # stays even if the job failed and it's no longer polled
+        elif session_clusters.sample_data is None:
+            status = {'state': 'failed', 'progress': 1.0}
+
+        session_store.set(session_id, 'clusters',
+                          session_clusters.get_state())
+        if session_clusters.sample_data is None:
+            if status['state'] == 'failed':
+                job_id = None
+            return job_placeholder(status, height=500), job_id
+
+        return session_clusters.get_figure(algorithm=value), None
 
     else:
-        return layout.get_empty_figure(height=100)
+        return layout.get_empty_figure(height=500), None
 
 
-# update SeeSoft or Prediction visualization for train sample no. 2
+# find train samples with the closest activations to the given JSON file
 @app.callback(
-    Output('train2-content', 'figure'),
-    [Input('train2-yes-button', 'n_clicks'),
-     Input('compare-radio', 'value')],
-    [State('train2-input', 'value')]
+    Output('neighbours-content', 'children'),
+    [Input('sample-name-hidden-div', 'children')],
+    [State('session-id', 'data')]
 )
-def update_train2_content(n_clicks, value1, value2):
-    if value2 == '':
-        return layout.get_empty_figure(height=650)
-
-    if n_clicks > 0:
-        if value1 == 'code':
-            local_seesoft = SeeSoft(path='BP-data/data/' + value2,
-                                    comments=True)
-            local_seesoft.draw()
-            return local_seesoft.get_figure(small=True)
+def update_neighbours(children, session_id):
+    if children != '':
+        nearest = session_neighbours(session_id)
 
-        else:
-            local_tree = Tree(path='BP-data/data/' + value2)
-            return local_tree.get_figure()
+        return '\n'.join('{}  (distance {:.5f})'.format(path, distance)
+                         for path, distance in nearest)
 
     else:
-        return layout.get_empty_figure(height=650)
+        return []
 
 
-# update Prediction visualization for train sample no. 3
+# copy the paths of the most similar train samples to the inputs for
+# comparison of multiple samples
 @app.callback(
-    Output('train3-prediction', 'figure'),
-    [Input('train3-yes-button', 'n_clicks')],
-    [State('train3-input', 'value')]
+    Output({'type': 'train-input', 'index': ALL}, 'value'),
+    [Input('neighbours-button', 'n_clicks')],
+    [State('session-id', 'data')]
 )
-def update_train3_prediction(n_clicks, value):
-    global model
-    if value == '':
-        return layout.get_empty_figure(height=100)
+def use_neighbours(n_clicks, session_id):
+    if n_clicks == 0:
+        raise PreventUpdate
 
-    if n_clicks > 0:
-        local_sample = Sample(path='BP-data/data/' + value, model=model)
-        local_prediction = Prediction(sample=local_sample)
-        return local_prediction.get_figure(small=True)
+    paths = ['' for _ in range(TRAIN_SAMPLES_NUM)]
+    for i, (path, _) in enumerate(session_neighbours(session_id)):
+        paths[i] = path
 
-    else:
-        return layout.get_empty_figure(height=100)
+    return paths
 
 
-# update SeeSoft or Prediction visualization for train sample no. 3
+# create new Prediction visualization for given JSON file
 @app.callback(
-    Output('train3-content', 'figure'),
-    [Input('train3-yes-button', 'n_clicks'),
-     Input('compare-radio', 'value')],
-    [State('train3-input', 'value')]
+    Output('prediction-content', 'figure'),
+    [Input('sample-name-hidden-div', 'children')],
+    [State('session-id', 'data')]
 )
-def update_train3_content(n_clicks, value1, value2):
-    if value2 == '':
-        return layout.get_empty_figure(height=650)
-
-    if n_clicks > 0:
-        if value1 == 'code':
-            local_seesoft = SeeSoft(path='BP-data/data/' + value2,
-                                    comments=True)
-            local_seesoft.draw()
-            return local_seesoft.get_figure(small=True)
-
-        else:
-            local_tree = Tree(path='BP-data/data/' + value2)
-            return local_tree.get_figure()
+def update_input_prediction(children, session_id):
+    if children != '':
+        return session_analysis(session_id).prediction.get_figure()
 
     else:
-        return layout.get_empty_figure(height=650)
+        return layout.get_empty_figure(height=120)
 
 
-# update Prediction visualization for train sample no. 4
+# for the sample comparison create the same Prediction visualization for
+# given JSON file as was used in the upper part
 @app.callback(
-    Output('train4-prediction', 'figure'),
-    [Input('train4-yes-button', 'n_clicks')],
-    [State('train4-input', 'value')]
+    Output('sample-prediction', 'figure'),
+    [Input('sample-name-hidden-div', 'children')],
+    [State('session-id', 'data')]
 )
-def update_train4_prediction(n_clicks, value):
-    global model
-    if value == '':
-        return layout.get_empty_figure(height=100)
-
-    if n_clicks > 0:
-        local_sample = Sample(path='BP-data/data/' + value, model=model)
-        local_prediction = Prediction(sample=local_sample)
-        return local_prediction.get_figure(small=True)
+def update_sample_prediction(children, session_id):
+    if children != '':
+        prediction = session_analysis(session_id).prediction
+        return prediction.get_figure(small=True)
 
     else:
         return layout.get_empty_figure(height=100)
 
 
-# update SeeSoft or Prediction visualization for train sample no. 4
+# for the sample comparison create the same SeeSoft or AST visualization as was
+# used in the upper part
+# the callback is chained after the upper AST visualization, so the same
+# nodes are expanded in both of them
 @app.callback(
-    Output('train4-content', 'figure'),
-    [Input('train4-yes-button', 'n_clicks'),
-     Input('compare-radio', 'value')],
-    [State('train4-input', 'value')]
+    Output('sample-content', 'figure'),
+    [Input('sample-name-hidden-div', 'children'),
+     Input('compare-radio', 'value'),
+     Input('tree-version', 'data')],
+    [State('session-id', 'data')]
 )
-def update_train4_content(n_clicks, value1, value2):
-    if value2 == '':
-        return layout.get_empty_figure(height=650)
+def update_sample_content(children, value, tree_version, session_id):
+    if children != '':
+        if value == 'code':
+            # expanding the AST doesn't change SeeSoft
+            triggered = [t['prop_id'] for t in
+                         dash.callback_context.triggered]
+            if triggered == ['tree-version.data']:
+                raise PreventUpdate
 
-    if n_clicks > 0:
-        if value1 == 'code':
-            local_seesoft = SeeSoft(path='BP-data/data/' + value2,
-                                    comments=True)
-            local_seesoft.draw()
-            return local_seesoft.get_figure(small=True)
+            return session_analysis(session_id).seesoft_figure(small=True)
 
         else:
-            local_tree = Tree(path='BP-data/data/' + value2)
-            return local_tree.get_figure()
+            return session_tree(session_id).get_figure()
 
     else:
         return layout.get_empty_figure(height=650)
 
 
-# update Prediction visualization for train sample no. 5
+# update Prediction and SeeSoft or AST visualization for the train sample in
+# the comparison slot, the sample is analyzed by the background job, which is
+# polled until it's finished
 @app.callback(
-    Output('train5-prediction', 'figure'),
-    [Input('train5-yes-button', 'n_clicks')],
-    [State('train5-input', 'value')]
+    [Output({'type': 'train-prediction', 'index': MATCH}, 'figure'),
+     Output({'type': 'train-content', 'index': MATCH}, 'figure'),
+     Output({'type': 'train-job', 'index': MATCH}, 'data')],
+    [Input({'type': 'train-yes-button', 'index': MATCH}, 'n_clicks'),
+     Input('compare-radio', 'value'),
+     Input({'type': 'train-interval', 'index': MATCH}, 'n_intervals')],
+    [State({'type': 'train-input', 'index': MATCH}, 'value'),
+     State({'type': 'train-job', 'index': MATCH}, 'data')]
 )
-def update_train5_prediction(n_clicks, value):
-    global model
-    if value == '':
-        return layout.get_empty_figure(height=100)
-
-    if n_clicks > 0:
-        local_sample = Sample(path='BP-data/data/' + value, model=model)
-        local_prediction = Prediction(sample=local_sample)
-        return local_prediction.get_figure(small=True)
-
-    else:
-        return layout.get_empty_figure(height=100)
+def update_train_sample(n_clicks, value1, n_intervals, value2, job_id):
+    triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+    polling = all(prop_id.endswith('.n_intervals') for prop_id in triggered)
 
+    if polling:
+        if not job_id:
+            raise PreventUpdate
 
-# update SeeSoft or Prediction visualization for train sample no. 5
-@app.callback(
-    Output('train5-content', 'figure'),
-    [Input('train5-yes-button', 'n_clicks'),
-     Input('compare-radio', 'value')],
-    [State('train5-input', 'value')]
-)
-def update_train5_content(n_clicks, value1, value2):
-    if value2 == '':
-        return layout.get_empty_figure(height=650)
+    elif not value2 or n_clicks == 0:
+        empty_prediction = layout.get_empty_figure(height=100)
+        return empty_prediction, layout.get_empty_figure(height=650), None
 
-    if n_clicks > 0:
-        if value1 == 'code':
-            local_seesoft = SeeSoft(path='BP-data/data/' + value2,
-                                    comments=True)
-            local_seesoft.draw()
-            return local_seesoft.get_figure(small=True)
+    else:
+        # new sample or visualization was chosen
+        job_id = None
 
-        else:
-            local_tree = Tree(path='BP-data/data/' + value2)
-            return local_tree.get_figure()
+    path = 'BP-data/data/' + value2
+    job_id, status = job_status(
+        job_id, lambda: submit_comparison_job(path, value1))
+    if status['state'] == 'done':
+        prediction, content = status['result']
+        return prediction, content, None
 
-    else:
-        return layout.get_empty_figure(height=650)
+    if status['state'] == 'failed':
+        job_id = None
+    empty_prediction = layout.get_empty_figure(height=100)
+    return empty_prediction, job_placeholder(status, height=650), job_id
 
 
-# update Network activations visualization
+# update Network activations visualization, the figure is created by
+# the background job, which is polled until it's finished
 @app.callback(
-    Output('sample-network', 'figure'),
-    [Input('sample-name-hidden-div', 'children')]
+    [Output('sample-network', 'figure'),
+     Output('network-job', 'data')],
+    [Input('sample-name-hidden-div', 'children'),
+     Input('network-interval', 'n_intervals')],
+    [State('network-job', 'data'),
+     State('session-id', 'data')]
 )
-def update_network(children):
-    global sample
-
+def update_network(children, n_intervals, job_id, session_id):
     if children != '':
-        local_network = Network(sample=sample)
-        return local_network.get_figure()
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        if 'sample-name-hidden-div.children' in triggered:
+            job_id = None
+        elif not job_id:
+            raise PreventUpdate
+
+        job_id, status = job_status(
+            job_id, lambda: submit_network_job(session_id))
+        if status['state'] == 'done':
+            return status['result'], None
+
+        if status['state'] == 'failed':
+            job_id = None
+        return job_placeholder(status, height=900), job_id
 
     else:
-        return layout.get_empty_figure(height=900)
+        return layout.get_empty_figure(height=900), None
 
 
 # show/hide Network visualization
@@ -1033,16 +893,67 @@ def show_network(n_clicks):
         }
 
 
+# when the large LuaCode is scrolled (close to) out of the rendered lines,
+# request rendering of the lines around the first visible line
+app.clientside_callback(
+    '''
+    function load_lua_code_lines(n_intervals, luacode_window) {
+        var element = document.getElementById("luacode-content");
+        if (!element || !luacode_window ||
+            (luacode_window.first == 0 &&
+             luacode_window.last == luacode_window.lines)) {
+            return window.dash_clientside.no_update;
+        }
+
+        // line height is 15px, padding is 20px, lines closer than 50 lines
+        // to the end of the rendered lines are considered out of them
+        var first = Math.floor(Math.max(element.scrollTop - 20, 0) / 15);
+        var last = Math.ceil((element.scrollTop + element.clientHeight) / 15);
+        if ((luacode_window.first > 0 && first < luacode_window.first + 50) ||
+            (luacode_window.last < luacode_window.lines &&
+             last > luacode_window.last - 50)) {
+            return first;
+        }
+
+        return window.dash_clientside.no_update;
+    }
+    ''',
+    Output('luacode-scroll', 'data'),
+    [Input('luacode-interval', 'n_intervals')],
+    [State('luacode-window', 'data')]
+)
+
+
 # handle interaction between LuaCode and SeeSoft components
 # highlight statements in LuaCode after click on SeeSoft
 # scroll LuaCode according to the clicked statement
+# if the clicked statement isn't rendered, LuaCode is just scrolled and
+# the statement is highlighted once the lines around it are rendered
 app.clientside_callback(
     '''
-    function scroll_lua_code_left(clickData) {
-        if (clickData) {
+    function scroll_lua_code_left(clickData, luacode_window) {
+        var point = null;
+        if (clickData && clickData !== window.luacode_click) {
+            window.luacode_click = clickData;
+            point = clickData.points[0];
+        }
+        else if (window.luacode_pending) {
+            point = window.luacode_pending;
+        }
+
+        if (point) {
             var element = document.getElementById("luacode-content");
-            var element_text_id = "luacode-content" + clickData.points[0].text;
+            var element_text_id = "luacode-content" + point.text;
             var element_text = document.getElementById(element_text_id);
+            if (!element_text) {
+                window.luacode_pending = point;
+                if (element) {
+                    element.scrollTop = point.customdata;
+                }
+                return "";
+            }
+
+            window.luacode_pending = null;
             var color = element_text.style.backgroundColor;
             var bounding = element.getBoundingClientRect();
             var text_bounding = element_text.getBoundingClientRect();
@@ -1050,7 +961,7 @@ app.clientside_callback(
             // handle possible vertical scrolling
             if (text_bounding.top < bounding.top ||
                 text_bounding.bottom > bounding.bottom) {
-                element.scrollTop = clickData.points[0].customdata;
+                element.scrollTop = point.customdata;
             }
 
             // handle highlighting
@@ -1089,8 +1000,26 @@ app.clientside_callback(
     }
     ''',
     Output('hidden-div', 'children'),
-    [Input('seesoft-content', 'clickData')]
+    [Input('seesoft-content', 'clickData'),
+     Input('luacode-window', 'data')]
 )
 
+# poll the background jobs only while they are running
+for job, interval in [
+    ('clusters-job', 'clusters-interval'),
+    ('network-job', 'network-interval'),
+    ({'type': 'train-job', 'index': MATCH},
+     {'type': 'train-interval', 'index': MATCH})
+]:
+    app.clientside_callback(
+        '''
+        function disable_job_polling(job_id) {
+            return !job_id;
+        }
+        ''',
+        Output(interval, 'disabled'),
+        [Input(job, 'data')]
+    )
+
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -0,0 +1,152 @@
+"""
+Analysis of the submitted sample shared by all visualization components.
+JSON file is parsed, the source code is read and tagged and the NN inference
+is run just once for each sample, the callbacks then only create figures
+from the prepared components. Analyses are memoized by the path and
+the modification time of the JSON file and the version of the NN model, so
+the samples are analyzed again when the model is reloaded.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from network.registry import model_version
+from sample import Sample
+from components.luacode import LuaCode
+from components.seesoft import cached_figure
+from components.scatterplot import ScatterPlot
+from components.tree import Tree
+from components.prediction import Prediction
+
+# maximum number of analyses kept in the memory
+ANALYSIS_CACHE_SIZE = 8
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+# analyses keyed by the path and modification time of the JSON file and
+# the version of the NN model, from the least recently used
+analyses = OrderedDict()
+analyses_lock = threading.Lock()
+# locks of the analyses which are being created, so each sample is analyzed
+# just once even if it's requested by multiple callbacks at the same time
+pending_locks = dict()
+
+
+class SampleAnalysis:
+    """
+    Class containing the sample and all components derived from it, which
+    are needed for its visualization. Components are shared by the callbacks
+    (and sessions), so they mustn't be modified.
+
+    Attributes
+    ----------
+    path : str
+        path to the JSON file
+    key : tuple
+        real path and modification time of the JSON file and version of
+        the NN model, which identify the analysis
+    sample : Sample
+        sample with the preprocessed data, activations and label
+    luacode : LuaCode
+        LuaCode visualization, which contains the tag table of the source
+        code shared with SeeSoft
+    scatterplot : ScatterPlot
+        ScatterPlot visualization with the traces already built
+    tree : Tree
+        AST visualization with the layout already computed
+    prediction : Prediction
+        visualization of the prediction
+
+    Methods
+    -------
+    seesoft_figure(small=False)
+        Returns figure of SeeSoft visualization as dict.
+    """
+
+    def __init__(self, path: str, report=None):
+        """
+        Reads the JSON file, runs the NN inference, reads and tags
+        the source code and prepares all components.
+
+        Parameters
+        ----------
+        path : str
+            path to the JSON file which contains preprocessed LUA source code
+        report : function or None, optional
+            function accepting the progress of the analysis (from 0 to 1),
+            which is called after each stage (default is None)
+        """
+
+        log.debug('Analyzing sample {}'.format(path))
+        report = report or (lambda fraction: None)
+        self.path = path
+        self.key = (os.path.realpath(path), os.path.getmtime(path),
+                    model_version())
+        self.sample = Sample(path=path)
+        report(0.5)
+        self.luacode = LuaCode(data=self.sample.data)
+        report(0.7)
+        self.scatterplot = ScatterPlot(
+            data=self.sample.data, source_code=self.luacode.source_code)
+        report(0.75)
+        self.tree = Tree(path=path, data=self.sample.data)
+        report(0.95)
+        self.prediction = Prediction(sample=self.sample)
+        report(1.0)
+
+    def seesoft_figure(self, small=False) -> dict:
+        """
+        Returns figure of SeeSoft visualization as dict, figures are cached
+        by components.seesoft.
+
+        Parameters
+        ----------
+        small : bool, optional
+            determines the size of the figure (default is False)
+
+        Returns
+        -------
+        dict
+            figure containing the colorful representation of the source code
+        """
+
+        return cached_figure(self.path, small=small, data=self.sample.data,
+                             tag_table=self.luacode.tag_table)
+
+
+# returns analysis of the JSON file, the analysis is created only if
+# the file wasn't analyzed yet by the current NN model or it has changed
+# since, the progress of its creation is passed to report
+def get_analysis(path: str, report=None) -> SampleAnalysis:
+    key = (os.path.realpath(path), os.path.getmtime(path), model_version())
+
+    with analyses_lock:
+        if key in analyses:
+            analyses.move_to_end(key)
+            return analyses[key]
+        lock = pending_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        # the analysis might have been created while waiting for the lock
+        with analyses_lock:
+            if key in analyses:
+                analyses.move_to_end(key)
+                return analyses[key]
+
+        try:
+            analysis = SampleAnalysis(path, report=report)
+        except Exception:
+            with analyses_lock:
+                pending_locks.pop(key, None)
+            raise
+
+        with analyses_lock:
+            analyses[key] = analysis
+            while len(analyses) > ANALYSIS_CACHE_SIZE:
+                analyses.popitem(last=False)
+            pending_locks.pop(key, None)
+
+    return analysis
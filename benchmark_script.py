@@ -0,0 +1,57 @@
+"""
+Simple script for measuring how the tagging of the source code (building
+of TagTable) scales with the nesting depth of the AST. Synthetic ASTs are
+chains of nested nodes, each node spans a few lines of the source code
+(half of them shared with its child), so the total length of the nodes
+grows linearly with the depth. Time per node should stay roughly the same.
+"""
+
+import sys
+import time
+from components.tagtable import TagTable
+from components.tagtable import CONTAINERS
+
+# number of characters of each node
+NODE_LENGTH = 80
+DEPTHS = [1000, 2000, 4000, 8000, 16000, 32000]
+REPEAT = 5
+
+
+# returns synthetic data with a chain of nested nodes of given depth and
+# source code of the corresponding length
+def nested_data(depth: int) -> (dict, str):
+    line = 'local x = 1 -- comment\n'
+    length = (depth + 1) * NODE_LENGTH // 2
+    source_code = (line * (length // len(line) + 1))[:length]
+
+    root = dict()
+    node = root
+    for i in range(depth):
+        node['position'] = i * NODE_LENGTH // 2 + 1
+        node['characters_count'] = NODE_LENGTH
+        node['container'] = CONTAINERS[1 + i % (len(CONTAINERS) - 1)]
+        if i < depth - 1:
+            node['children'] = [dict()]
+            node = node['children'][0]
+
+    return {'nodes': [root]}, source_code
+
+
+def measure(depth: int) -> float:
+    data, source_code = nested_data(depth)
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        TagTable(data, source_code)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+if __name__ == '__main__':
+    depths = [int(arg) for arg in sys.argv[1:]] or DEPTHS
+    print('{:>8} {:>12} {:>14}'.format('depth', 'time [ms]', 'per node [us]'))
+    for depth in depths:
+        seconds = measure(depth)
+        print('{:>8} {:>12.2f} {:>14.3f}'.format(
+            depth, seconds * 1e3, seconds * 1e6 / depth))
@@ -0,0 +1,213 @@
+"""
+Module containing LRU cache of the rendered components (e.g. images and
+finished figures), which are expensive to create and used repeatedly.
+"""
+
+import os
+import logging
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+
+class LRUCache:
+    """
+    Least recently used cache limited by the total size of the cached values
+    in bytes. Values are stored pickled, so that their size is known exactly
+    and the cached values can't be modified by the callers. Values evicted
+    from the memory can be optionally spilled to the disk, from where they
+    are loaded back when requested again.
+
+    Attributes
+    ----------
+    max_bytes : int
+        maximum total size of the values kept in the memory
+    spill_dir : str or None
+        directory for the values evicted from the memory, if None the evicted
+        values are dropped
+    max_spill_bytes : int
+        maximum total size of the values spilled to the disk
+    entries : OrderedDict
+        pickled values keyed by their keys, from the least recently used
+    spilled : OrderedDict
+        sizes of the values spilled to the disk keyed by their keys, from
+        the least recently used
+    size : int
+        total size of the values kept in the memory
+    spill_size : int
+        total size of the values spilled to the disk
+
+    Methods
+    -------
+    get(key)
+        Returns cached value for the key or None if it's not cached.
+    put(key, value)
+        Caches the value under the key.
+    clear()
+        Removes all cached values including the spilled ones.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir=None,
+                 max_spill_bytes=None):
+        """
+        Parameters
+        ----------
+        max_bytes : int
+            maximum total size of the values kept in the memory
+        spill_dir : str or None, optional
+            directory for the values evicted from the memory, if None
+            the evicted values are dropped (default is None)
+        max_spill_bytes : int or None, optional
+            maximum total size of the values spilled to the disk, if None it's
+            4 times max_bytes (default is None)
+        """
+
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes or 4 * max_bytes
+        self.entries = OrderedDict()
+        self.spilled = OrderedDict()
+        self.size = 0
+        self.spill_size = 0
+        self.__lock = threading.Lock()
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def __spill_path(self, key) -> str:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.spill_dir, '{}.pkl'.format(name))
+
+    def __spill(self, key, raw: bytes):
+        """
+        Writes the evicted value to the disk, the least recently spilled
+        values are removed when the spill directory is full.
+        """
+
+        if not self.spill_dir or len(raw) > self.max_spill_bytes:
+            return
+
+        try:
+            with open(self.__spill_path(key), 'wb') as f:
+                f.write(raw)
+        except OSError as e:
+            log.debug('Cannot spill cached value: {}'.format(e))
+            return
+
+        self.spilled[key] = len(raw)
+        self.spill_size += len(raw)
+        while self.spill_size > self.max_spill_bytes:
+            old_key, old_size = self.spilled.popitem(last=False)
+            self.spill_size -= old_size
+            self.__remove_spilled(old_key)
+
+    def __remove_spilled(self, key):
+        try:
+            os.remove(self.__spill_path(key))
+        except OSError:
+            pass
+
+    def __unspill(self, key) -> bytes or None:
+        """
+        Reads the spilled value from the disk and removes it from there,
+        returns None if the value wasn't spilled.
+        """
+
+        if key not in self.spilled:
+            return None
+
+        self.spill_size -= self.spilled.pop(key)
+        try:
+            with open(self.__spill_path(key), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return None
+        finally:
+            self.__remove_spilled(key)
+
+        return raw
+
+    def __store(self, key, raw: bytes):
+        """
+        Stores the pickled value in the memory and evicts the least recently
+        used values so that the size limit is kept.
+        """
+
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+
+        self.entries[key] = raw
+        self.size += len(raw)
+
+        while self.size > self.max_bytes and self.entries:
+            old_key, old_raw = self.entries.popitem(last=False)
+            self.size -= len(old_raw)
+            self.__spill(old_key, old_raw)
+
+    def get(self, key):
+        """
+        Returns cached value for the key or None if it's not cached.
+
+        Parameters
+        ----------
+        key :
+            hashable key of the value
+
+        Returns
+        -------
+        cached value or None
+        """
+
+        with self.__lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                raw = self.entries[key]
+            else:
+                raw = self.__unspill(key)
+                if raw is None:
+                    return None
+                self.__store(key, raw)
+
+        return pickle.loads(raw)
+
+    def put(self, key, value):
+        """
+        Caches the value under the key. Values larger than max_bytes are
+        not cached at all.
+
+        Parameters
+        ----------
+        key :
+            hashable key of the value
+        value :
+            picklable value
+        """
+
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(raw) > self.max_bytes:
+            return
+
+        with self.__lock:
+            if key in self.spilled:
+                self.spill_size -= self.spilled.pop(key)
+                self.__remove_spilled(key)
+            self.__store(key, raw)
+
+    def clear(self):
+        """
+        Removes all cached values including the spilled ones.
+        """
+
+        with self.__lock:
+            for key in self.spilled:
+                self.__remove_spilled(key)
+            self.entries.clear()
+            self.spilled.clear()
+            self.size = 0
+            self.spill_size = 0
@@ -1,36 +1,54 @@
-import os
 import logging
+import threading
 from sample import Sample
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import sklearn
 from sklearn.manifold import TSNE
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 from constant import CLUSTER_COLORS
 from constant import COLUMNS
+from network.store import load_activations
+from network.store import fingerprint
+from network.store import load_reductions
+from network.store import save_reductions
+from network.registry import model_version
 import dash_core_components as dcc
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 log.addHandler(logging.StreamHandler())
 
+# number of the train samples which can be compared with the analyzed sample
+# (and highlighted in the cluster diagram), the layout of the app adapts to it
 TRAIN_SAMPLES_NUM = 5
-CSV_PATH = (os.path.dirname(os.path.realpath(__file__))
-            + '/../network/train_data_activations_layer4.csv')
+# layer of NN whose activations are visualized
+ACTIVATIONS_LAYER = 4
+TSNE_PERPLEXITY = 40
+# number of train samples used to place analyzed sample into t-SNE embedding
+TSNE_NEIGHBOURS = 10
+
+# train data of the cluster diagram shared by the whole process together with
+# the version of the NN model, for which they were loaded
+shared_clusters = dict()
+shared_clusters_lock = threading.Lock()
 
 
 class Clusters:
     """
     Class for cluster visualization of all train data together with currently
-    analyzed sample and possibly 5 more highlighted train samples.
+    analyzed sample and possibly TRAIN_SAMPLES_NUM more highlighted train
+    samples.
 
     Attributes
     ----------
     train_samples : list of str
-        list of max 5 JSON samples, e.g. '30log/AST1.json'
+        list of max TRAIN_SAMPLES_NUM JSON samples, e.g. '30log/AST1.json'
     train_data : pd.dataFrame
         train data predictions (last layer activations + label) loaded from
-        network/train_data_activations_layer4.csv
+        the activation store in directory network
     sample_data : pd.dataFrame
         activations from the last layer and prediction for currently analyzed
         sample
@@ -41,6 +59,15 @@ class Clusters:
     tsne_sample_trace : dict
         x and y coordinates of currently analyzed sample in diagram using t-SNE
         algorithm for reduction of dimensionality
+    scaler : StandardScaler
+        scaler fitted on the train data activations
+    train_std : np.ndarray
+        train data activations standardized by the scaler
+    tsne_embedding : np.ndarray
+        t-SNE coordinates of the train data, one row for each sample
+    pca : PCA
+        PCA with 2 components fitted on the standardized train data
+        activations
     pca_traces : list of dict
         list of dict for every possible label (result of prediction), each
         dict contains PCA coordinates of train data samples which were
@@ -55,8 +82,14 @@ class Clusters:
         If a sample wasn't provided when the Clusters instance was created,
         the sample can be added by this method. The activations from the last
         layer and the prediction (label) is read from the sample and
-        the coordinates are calculated for training data and currently
-        analyzed sample using both t-SNE and PCA for dimensionality reduction.
+        the coordinates are calculated for currently analyzed sample using
+        both t-SNE and PCA for dimensionality reduction.
+    get_state()
+        Returns attributes describing currently analyzed sample and
+        highlighted train samples.
+    set_state(state)
+        Restores attributes describing currently analyzed sample and
+        highlighted train samples.
     get_figure(algorithm, height=None)
         Returns go.Figure instance of cluster diagram with coordinates
         calculated by given algorithm.
@@ -67,11 +100,13 @@ class Clusters:
 
     def __init__(self, sample=None):
         """
-        Reads train data activations and predictions from
-        network/train_data_activations_layer4.csv. If the sample is provided,
-        prediction data and activations are assigned to sample_data as well as
-        coordinates are calculated for training data and currently analyzed
-        sample using both t-SNE and PCA for dimensionality reduction.
+        Reads train data activations and predictions from the activation
+        store in directory network and fits the scaler, PCA and t-SNE on
+        them.
+        If the sample is provided, prediction data and activations are
+        assigned to sample_data as well as coordinates are calculated for
+        currently analyzed sample using both t-SNE and PCA for dimensionality
+        reduction.
 
         Parameters
         ----------
@@ -83,23 +118,23 @@ class Clusters:
         self.train_samples = [None for _ in range(TRAIN_SAMPLES_NUM)]
         self.train_data = self.__load_train_data()
 
+        # scaler, PCA and t-SNE are fitted only once on the train data,
+        # analyzed samples are just placed among them, so the train data
+        # don't move
+        reductions = self.__fit_reductions()
+        self.scaler = reductions['scaler']
+        self.pca = reductions['pca']
+        self.train_std = self.scaler.transform(self.__train_activations())
+        self.tsne_embedding = reductions['tsne_results']
+        self.pca_traces = self.__split_traces(reductions['pca_results'])
+        self.tsne_traces = self.__split_traces(self.tsne_embedding)
+
         if sample:
-            self.sample_data = self.__load_sample_data(sample)
-            log.debug('Performing fit_transform for T-SNE...')
-            self.tsne_traces, self.tsne_sample_trace = (
-                self.__prepare_tsne_traces()
-            )
-            log.debug('Performing fit_transform for PCA...')
-            self.pca_traces, self.pca_sample_trace = (
-                self.__prepare_pca_traces()
-            )
-            log.debug('Successfully finished fit_transform...')
+            self.add_sample(sample)
 
         else:
             self.sample_data = None
-            self.tsne_traces = None
             self.tsne_sample_trace = None
-            self.pca_traces = None
             self.pca_sample_trace = None
 
     @staticmethod
@@ -134,8 +169,8 @@ class Clusters:
     @staticmethod
     def __load_train_data() -> pd.DataFrame:
         """
-        Reads and pre-processes train data activations and predictions from
-        network/train_data_activations_layer4.csv.
+        Reads train data activations and predictions from the activation
+        store in directory network.
 
         Returns
         -------
@@ -144,122 +179,179 @@ class Clusters:
             the prediction (label) for the train data
         """
 
-        df = pd.read_csv(CSV_PATH)
-        df = df.dropna()
-        layer = [l for l in df.columns if 'layer' in l][0]
-        dimensions = str(df[layer][0]).split(' ')
-        dimensions = ['d{}'.format(d) for d in range(len(dimensions))]
-        df[dimensions] = df[layer].str.split(expand=True)
-        df = df.drop(columns=[layer])
+        meta, activations = load_activations(ACTIVATIONS_LAYER)
+        # skip modules without JSON file in the data directory
+        rows = (meta['data path'] != '').values
+        dimensions = ['d{}'.format(d) for d in range(activations.shape[1])]
+
+        df = meta[rows].reset_index(drop=True)
+        df[dimensions] = pd.DataFrame(activations[rows], columns=dimensions)
 
         return df
 
-    def __prepare_pca_traces(self):
+    def __train_activations(self) -> np.ndarray:
+        """
+        Returns activations of the train data as a 2D array.
+
+        Returns
+        -------
+        np.ndarray
+            activations of the train data, one row for each sample
+        """
+
+        return self.train_data.drop(
+            columns=['label', 'module path', 'data path']).values
+
+    def __split_traces(self, coordinates: np.ndarray):
         """
-        Performs dimensionality reduction of train data + analyzed sample using
-        PCA (Principal Component Analysis).
+        Splits 2D coordinates of the train data into traces according to
+        the labels of the train samples.
+
+        Parameters
+        ----------
+        coordinates : np.ndarray
+            x and y coordinates of the train data, one row for each sample
 
         Returns
         -------
         list of dict
             list of dict for every possible label (result of prediction), each
-            dict contains PCA coordinates of train data samples which were
+            dict contains coordinates of train data samples which were
             labeled with the corresponding label
-        dict
-            x and y coordinates of currently analyzed sample in diagram using
-            PCA for reduction of dimensionality
         """
 
         labels = self.train_data['label'].tolist()
         data_files = self.train_data['data path'].tolist()
-        data = self.train_data.drop(
-            columns=['label', 'module path', 'data path'])
+        x = coordinates[:, 0].tolist()
+        y = coordinates[:, 1].tolist()
 
-        # append sample module and get values
-        sample_data = self.sample_data.drop(columns=['label'])
-        data = data.append(sample_data, ignore_index=True)
-        X = data.values
-
-        X_std = StandardScaler().fit_transform(X)
-        pca = PCA()
-        pca.fit(X_std)
-        pca_results = pca.transform(X_std)
-
-        x = pca_results[:, 0]
-        y = pca_results[:, 1]
-
-        dimensions = len(data.columns)
+        dimensions = len(self.train_data.columns) - 3
         traces = [
             dict(x=list(), y=list(), text=list()) for _ in range(dimensions)
         ]
 
-        # select sample point from results
-        sample_trace = dict(x=x[len(x) - 1], y=y[len(y) - 1])
-
-        # labels list doesn't contain sample data label, so it's OK to do this
         for i, label in enumerate(labels):
             traces[label]['x'].append(x[i])
             traces[label]['y'].append(y[i])
             traces[label]['text'].append(data_files[i])
 
-        return traces, sample_trace
+        return traces
 
-    def __prepare_tsne_traces(self):
+    def __fit_reductions(self) -> dict:
         """
-        Performs dimensionality reduction of train data + analyzed sample using
-        t-SNE (t-distributed stochastic neighbor embedding).
+        Fits the scaler, PCA (Principal Component Analysis) with 2 components
+        and t-SNE (t-distributed stochastic neighbor embedding) on the train
+        data. The results are cached in the activation store, keyed by
+        fingerprint of the train data activations, the parameters of
+        the reductions and the version of the NN model, so they are computed
+        again only when the activations, the parameters or the model change.
 
         Returns
         -------
-        list of dict
-            list of dict for every possible label (result of prediction), each
-            dict contains t-SNE coordinates of train data samples which were
-            labeled with the corresponding label
         dict
-            x and y coordinates of currently analyzed sample in diagram using
-            t-SNE algorithm for reduction of dimensionality
+            scaler fitted on the train data ('scaler'), PCA fitted on
+            the standardized train data ('pca'), PCA and t-SNE coordinates of
+            the train data ('pca_results' and 'tsne_results')
         """
 
-        labels = self.train_data['label'].tolist()
-        data_files = self.train_data['data path'].tolist()
-        data = self.train_data.drop(
-            columns=['label', 'module path', 'data path'])
+        parameters = {
+            'layer': ACTIVATIONS_LAYER,
+            'pca_components': 2,
+            'tsne_perplexity': TSNE_PERPLEXITY,
+            'sklearn': sklearn.__version__,
+            'model': model_version()
+        }
+        key = fingerprint(ACTIVATIONS_LAYER, parameters)
+
+        reductions = load_reductions(key)
+        if reductions is not None:
+            log.debug('Loaded cached dimensionality reduction...')
+            return reductions
 
-        # append sample module and get values
-        sample_data = self.sample_data.drop(columns=['label'])
-        data = data.append(sample_data, ignore_index=True)
-        X = data.values
+        scaler = StandardScaler()
+        X_std = scaler.fit_transform(self.__train_activations())
 
-        X_std = StandardScaler().fit_transform(X)
-        tsne = TSNE(n_components=2, perplexity=40)
+        log.debug('Performing fit_transform for PCA...')
+        pca = PCA(n_components=2)
+        pca_results = pca.fit_transform(X_std)
+
+        log.debug('Performing fit_transform for T-SNE...')
+        tsne = TSNE(n_components=2, perplexity=TSNE_PERPLEXITY)
         tsne_results = tsne.fit_transform(X_std)
 
-        x = tsne_results[:, 0]
-        y = tsne_results[:, 1]
+        reductions = {
+            'scaler': scaler,
+            'pca': pca,
+            'pca_results': pca_results,
+            'tsne_results': tsne_results
+        }
+        save_reductions(key, reductions)
 
-        dimensions = len(data.columns)
-        traces = [
-            dict(x=list(), y=list(), text=list()) for _ in range(dimensions)
-        ]
+        return reductions
 
-        # select sample point from results
-        sample_trace = dict(x=x[len(x) - 1], y=y[len(y) - 1])
+    def __sample_std(self) -> np.ndarray:
+        """
+        Returns standardized activations of currently analyzed sample.
 
-        # labels list doesn't contain sample data label, so it's OK to do this
-        for i, label in enumerate(labels):
-            traces[label]['x'].append(x[i])
-            traces[label]['y'].append(y[i])
-            traces[label]['text'].append(data_files[i])
+        Returns
+        -------
+        np.ndarray
+            activations of the sample standardized by the scaler fitted on
+            the train data
+        """
+
+        X = self.sample_data.drop(columns=['label']).values
+
+        return self.scaler.transform(X)
+
+    def __prepare_pca_sample_trace(self) -> dict:
+        """
+        Projects currently analyzed sample using PCA fitted on the train data.
+
+        Returns
+        -------
+        dict
+            x and y coordinates of currently analyzed sample in diagram using
+            PCA for reduction of dimensionality
+        """
+
+        x, y = self.pca.transform(self.__sample_std())[0]
+
+        return dict(x=x, y=y)
+
+    def __prepare_tsne_sample_trace(self) -> dict:
+        """
+        Places currently analyzed sample into the t-SNE embedding of the train
+        data. Coordinates of the sample are weighted average of coordinates of
+        its nearest neighbours (in the space of standardized activations),
+        the weights are inverse distances.
 
-        return traces, sample_trace
+        Returns
+        -------
+        dict
+            x and y coordinates of currently analyzed sample in diagram using
+            t-SNE algorithm for reduction of dimensionality
+        """
+
+        distances = np.linalg.norm(self.train_std - self.__sample_std(),
+                                   axis=1)
+        k = min(TSNE_NEIGHBOURS, len(distances))
+        neighbours = np.argpartition(distances, k - 1)[:k]
+        weights = 1 / np.maximum(distances[neighbours], 1e-12)
+
+        x, y = np.average(self.tsne_embedding[neighbours], axis=0,
+                          weights=weights)
+
+        return dict(x=x, y=y)
 
     def add_sample(self, sample: Sample):
         """
         If a sample wasn't provided when the Clusters instance was created,
         the sample can be added by this method. Data from provided sample are
         used to get activations from last layer and the prediction (label).
-        Moreover, coordinates are determined for training data and currently
-        analyzed sample using both t-SNE and PCA for dimensionality reduction.
+        Moreover, coordinates are determined for currently analyzed sample
+        using both t-SNE and PCA for dimensionality reduction. Coordinates
+        of the train data stay the same.
 
         Parameters
         ----------
@@ -269,11 +361,52 @@ class Clusters:
         """
 
         self.sample_data = self.__load_sample_data(sample)
-        log.debug('Performing fit_transform for T-SNE...')
-        self.tsne_traces, self.tsne_sample_trace = self.__prepare_tsne_traces()
-        log.debug('Performing fit_transform for PCA...')
-        self.pca_traces, self.pca_sample_trace = self.__prepare_pca_traces()
-        log.debug('Successfully finished fit_transform...')
+        self.tsne_sample_trace = self.__prepare_tsne_sample_trace()
+        self.pca_sample_trace = self.__prepare_pca_sample_trace()
+
+    def get_state(self) -> dict:
+        """
+        Returns attributes describing currently analyzed sample and
+        highlighted train samples. Train data are the same for all analyzed
+        samples, so the state is small enough to be kept for each session
+        separately.
+
+        Returns
+        -------
+        dict
+            train samples, sample data and coordinates of the analyzed sample
+        """
+
+        return {
+            'train_samples': list(self.train_samples),
+            'sample_data': self.sample_data,
+            'tsne_sample_trace': self.tsne_sample_trace,
+            'pca_sample_trace': self.pca_sample_trace
+        }
+
+    def set_state(self, state: dict or None):
+        """
+        Restores attributes describing currently analyzed sample and
+        highlighted train samples.
+
+        Parameters
+        ----------
+        state : dict or None
+            state returned by get_state, if None there's no analyzed sample
+            and no highlighted train samples
+        """
+
+        if state is None:
+            self.train_samples = [None for _ in range(TRAIN_SAMPLES_NUM)]
+            self.sample_data = None
+            self.tsne_sample_trace = None
+            self.pca_sample_trace = None
+
+        else:
+            self.train_samples = list(state['train_samples'])
+            self.sample_data = state['sample_data']
+            self.tsne_sample_trace = state['tsne_sample_trace']
+            self.pca_sample_trace = state['pca_sample_trace']
 
     def get_figure(self, algorithm: str, height=None) -> go.Figure:
         """
@@ -395,3 +528,16 @@ class Clusters:
             },
             className=COLUMNS[columns]
         )
+
+
+# returns Clusters with the train data shared by the whole process (without
+# any sample), the train data are loaded again when the NN model is reloaded
+def get_clusters() -> Clusters:
+    version = model_version()
+
+    with shared_clusters_lock:
+        if shared_clusters.get('version') != version:
+            shared_clusters['clusters'] = Clusters()
+            shared_clusters['version'] = version
+
+        return shared_clusters['clusters']
@@ -8,15 +8,19 @@ import dash_html_components as html
 import base64
 
 
-def get_empty_figure(height: int):
+def get_empty_figure(height: int, text=None):
     """
     Creates empty grey placeholder component which shall be later substituted
     with diagram. The given height determines the height of the placeholder.
+    Optional text (e.g. progress of the computation) is displayed in
+    the middle of the placeholder.
 
     Parameters
     ----------
     height : int
         height of placeholder in pixels
+    text : str or None, optional
+        text displayed in the placeholder (default is None)
 
     Returns
     -------
@@ -41,7 +45,16 @@ def get_empty_figure(height: int):
                 'ticks': '',
                 'showgrid': False,
                 'zeroline': False
-            }
+            },
+            annotations=[{
+                'text': text,
+                'showarrow': False,
+                'xref': 'paper',
+                'yref': 'paper',
+                'x': 0.5,
+                'y': 0.5,
+                'font': {'color': '#7f7f7f'}
+            }] if text else None
         )
     }
 
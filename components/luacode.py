@@ -1,13 +1,19 @@
 import logging
 import json
 import urllib
-import chardet
 from typing import List
 from constant import COLORS
 from constant import LUA_LINE_HEIGHT
+from components.tagtable import TagTable
+from components.source import read_source_code
 import dash_html_components as html
 
 
+# modules with more lines are rendered in windows of WINDOW_LINES lines
+WINDOW_LINES = 400
+# number of lines rendered above the requested line
+WINDOW_BUFFER = 150
+
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 log.addHandler(logging.StreamHandler())
@@ -26,31 +32,42 @@ class LuaCode:
     source_code : str
         read original source code, structure of which is represented in
         the attribute data
-    tag_table : list of dict
-        dict for each character from the source code, each dict consists of
-        the character and the type of the statement (require, variable etc.)
+    tag_table : TagTable
+        the type of the statement (require, variable etc.) assigned to each
+        character from the source code
     color_text_table : list of dict
         each dict consists of string (statement or part of the statement)
         and the color assigned accordingly to the type of the statement
+    lines : list of list
+        sections of color_text_table split into the lines of the source code,
+        each section is a tuple of text, color and id of the html.Span
+        (None if the section isn't colorful)
 
     Methods
     -------
-    get_children(parent_id):
+    lines_count()
+        Returns number of lines of the source code.
+    window(line)
+        Returns range of lines which shall be rendered so that the given line
+        is visible.
+    get_children(parent_id, first_line=0, last_line=None):
         Returns list of html.Span objects which can be later used as children
         for html.Pre component.
-    view(dash_id)
+    view(dash_id, line=0)
         Returns html.Pre object which contains the colorful representation of
         the original source code.
     """
 
-    def __init__(self, path=None, url=None, data=None):
+    def __init__(self, path=None, url=None, data=None, tag_table=None):
         """
         According to the parameters given, the preprocessed data are read
         from JSON file (parameter path) or from the given url or
         simply copied from the given parameter data. If none of
         the parameters is provided, the function raises an error. Furthermore,
-        the original source code is read and tag_table and color_text_table
-        are initialized.
+        the original source code is read, tag_table is built (unless it's
+        provided) and the source code is split into colorful lines. Lines are
+        built here rather than on first use, since the instance is shared by
+        the threads of the app.
 
         Parameters
         ----------
@@ -62,6 +79,9 @@ class LuaCode:
             (default is None)
         data : dict or None, optional
             preprocessed data already read from JSON file
+        tag_table : TagTable or None, optional
+            tag table already built for the same data, e.g. shared with
+            SeeSoft (default is None)
         """
 
         if data:
@@ -78,144 +98,111 @@ class LuaCode:
                 with urllib.request.urlopen(url) as url_data:
                     self.data = json.loads(url_data.read().decode())
 
-        self.source_code = self.__read_source_code()
-        self.tag_table = [dict() for _ in range(len(self.source_code))]
+        if tag_table is not None:
+            self.source_code = tag_table.source_code
+            self.tag_table = tag_table
+        else:
+            self.source_code = read_source_code(self.data)
+            self.tag_table = TagTable(self.data, self.source_code)
         self.color_text_table = list()
+        self.lines = list()
+        self.__build_lines()
 
-    def __read_source_code(self) -> str:
+    def __build_color_text_table(self):
+        """
+        Builds list of dict (color_text_table) based on tag_table, where
+        each element consists of hex color and text (not just char anymore)
+        as the adjoining characters with the same container type are merged.
         """
-        Reads and returns LUA source code from path or url from the data.
 
-        Returns
-        --------
-        str
-            original LUA source code which was preprocessed and stored in
-            JSON file
+        self.color_text_table = [
+            {'text': text, 'color': COLORS[container]}
+            for text, container in self.tag_table.runs()
+        ]
+
+    def __build_lines(self):
+        """
+        Builds color_text_table and splits its sections into the lines of
+        the source code. Ids of the colorful sections are assigned in the order
+        from the beginning of the source code, so they're the same no matter
+        which lines are rendered.
         """
 
-        # if there's path provided read form it, otherwise read from url
-        if self.data['path']:
-            raw_data = open(self.data['path'], 'rb').read()
+        self.__build_color_text_table()
 
-        else:
-            log.debug('Loading module file from {}'.format(self.data['url']))
-            url_file = urllib.request.urlopen(self.data['url'])
-            raw_data = url_file.read()
+        lines = [list()]
+        child_id = 1
+        for section in self.color_text_table:
+            # '\n' never belongs to any container, so colorful sections are
+            # always within one line
+            if section['color']:
+                lines[-1].append(
+                    (section['text'], section['color'], child_id))
+                child_id += 1
+                continue
 
-        chardet_result = chardet.detect(raw_data)
-        if chardet_result['encoding'] not in ['ascii', 'utf-8']:
-            raw_data = raw_data.decode('iso-8859-1').encode('utf-8')
+            for i, text in enumerate(section['text'].split('\n')):
+                if i > 0:
+                    lines.append(list())
+                if text:
+                    lines[-1].append((text, None, None))
 
-        return raw_data.decode('utf-8')
+        self.lines = lines
 
-    def __add_color(self, node: dict):
+    def lines_count(self) -> int:
         """
-        Adds color to the tag_table for each character included in the given
-        node. Colors are assigned according to the container type of the node.
+        Returns number of lines of the source code.
 
-        Parameters
-        ----------
-        node : dict
-            information about the node such as type of container (type of
-            statement), order in the source code, number of the children etc.
+        Returns
+        -------
+        int
+            number of lines of the source code
         """
 
-        position = node['position'] - 1
-        for i in range(position, position + node['characters_count']):
-            self.tag_table[i]['container'] = node['container']
-            self.tag_table[i]['char'] = self.source_code[i]
-
-            if 'children' in node:
-                for child in node['children']:
-                    self.__add_color(child)
+        return len(self.lines)
 
-    def __build_tag_table(self):
-        """
-        Builds tag_table so that every character of the source code has color
-        assigned according to their container type.
+    def window(self, line: int) -> (int, int):
         """
+        Returns range of lines which shall be rendered so that the given line
+        and WINDOW_BUFFER lines above it are visible. Modules with at most
+        WINDOW_LINES lines are always rendered whole.
 
-        # assign container to each character form source code
-        for node in self.data['nodes']:
-            self.__add_color(node)
-
-        # add None container to characters which don't belong anywhere
-        for i, byte in enumerate(self.tag_table):
-            if not byte:
-                byte['container'] = None
-                byte['char'] = self.source_code[i]
-
-            if byte['char'] == '\n':
-                byte['container'] = None
-
-        # remove '\r'
-        self.tag_table = list(
-            filter(lambda b: b['char'] != '\r', self.tag_table)
-        )
-
-        # add comments and other code segments which don't belong to any
-        # container to 'comment' container
-        for byte in self.tag_table:
-            if not byte['container'] and not byte['char'].isspace():
-                byte['container'] = 'comment'
-
-        # make spaces in comments colorful instead of white
-        for i, byte in enumerate(self.tag_table):
-            if (
-                    byte['char'] == ' '
-                    and i - 1 >= 0
-                    and i + 1 < len(self.tag_table)
-                    and self.tag_table[i - 1]['container'] == 'comment'
-                    and (self.tag_table[i + 1]['container'] == 'comment'
-                         or self.tag_table[i + 1]['char'].isspace())
-            ):
-                byte['container'] = 'comment'
-
-        # handle white spaces in the beginning of the line
-        # it's about keeping tabs white in the final image
-        for i, byte in enumerate(self.tag_table):
-            if byte['char'] == '\n':
-                j = i + 1
-
-                while (j < len(self.tag_table) and
-                       self.tag_table[j]['char'].isspace()):
-                    self.tag_table[j]['container'] = None
-                    j += 1
+        Parameters
+        ----------
+        line : int
+            number of the line (from 0) which shall be visible
 
-    def __build_color_text_table(self):
-        """
-        Builds list of dict (color_text_table) based on tag_table, where
-        each element consists of hex color and text (not just char anymore)
-        as the adjoining characters with the same container type are merged.
+        Returns
+        -------
+        int, int
+            first line and the line after the last line of the window
         """
 
-        self.color_text_table.append(
-            {'text': self.tag_table[0]['char'],
-             'color': COLORS[self.tag_table[0]['container']]}
-        )
+        lines_count = self.lines_count()
+        first_line = max(0, min(line - WINDOW_BUFFER,
+                                lines_count - WINDOW_LINES))
 
-        for i in range(1, len(self.tag_table)):
-            if (
-                    self.tag_table[i]['container'] ==
-                    self.tag_table[i - 1]['container']
-            ):
-                self.color_text_table[-1]['text'] += self.tag_table[i]['char']
-            else:
-                self.color_text_table.append(
-                    {'text': self.tag_table[i]['char'],
-                     'color': COLORS[self.tag_table[i]['container']]}
-                )
+        return first_line, min(lines_count, first_line + WINDOW_LINES)
 
-    def get_children(self, parent_id: str) -> List:
+    def get_children(self, parent_id: str, first_line=0,
+                     last_line=None) -> List:
         """
-        Builds tag_table and color_text_table. Then returns list of html.Span
-        objects which can be later used as children for html.Pre component.
+        Returns list of html.Span objects which can be later used as
+        children for html.Pre component.
+        Only the given range of lines is rendered, the other lines are
+        replaced by empty blocks of the same height, so that the scrolling
+        positions stay the same.
 
         Parameters
         ----------
         parent_id : str
             id of the parent component (e.g. html.Pre component) so that the
             html.Span elements can have ids derived from the parent id
+        first_line : int, optional
+            first rendered line (default is 0)
+        last_line : int or None, optional
+            line after the last rendered line, if None all lines until the end
+            are rendered (default is None)
 
         Returns
         -------
@@ -223,44 +210,58 @@ class LuaCode:
             list of html.Span instances determined from the color_text_table
         """
 
-        self.__build_tag_table()
-        self.__build_color_text_table()
+        lines_count = self.lines_count()
+        if last_line is None or last_line > lines_count:
+            last_line = lines_count
 
         children = list()
-        child_id = 1
-        for section in self.color_text_table:
-            if section['text'] == '\n' and not section['color']:
-                children.append(html.Br())
-
-            elif not section['color']:
-                children.append(section['text'])
-
-            else:
-                children.append(
-                    html.Span(
-                        id='{}{}'.format(parent_id, child_id),
-                        children=section['text'],
-                        style={
-                            'background-color': section['color']
-                        }
+        if first_line > 0:
+            children.append(html.Div(
+                style={'height': '{}px'.format(first_line * LUA_LINE_HEIGHT)}
+            ))
+
+        for i in range(first_line, last_line):
+            for text, color, child_id in self.lines[i]:
+                if not color:
+                    children.append(text)
+
+                else:
+                    children.append(
+                        html.Span(
+                            id='{}{}'.format(parent_id, child_id),
+                            children=text,
+                            style={
+                                'background-color': color
+                            }
+                        )
                     )
-                )
 
-                child_id += 1
+            if i < lines_count - 1:
+                children.append(html.Br())
+
+        if last_line < lines_count:
+            children.append(html.Div(
+                style={'height': '{}px'.format(
+                    (lines_count - last_line) * LUA_LINE_HEIGHT)}
+            ))
 
         return children
 
-    # children may contain pure string element, html.Br() or html.Span element
+    # children may contain pure string element, html.Br(), html.Div() (empty
+    # block replacing lines which are not rendered) or html.Span element
     # with corresponding color background
-    def view(self, dash_id: str):
+    def view(self, dash_id: str, line=0):
         """
         Returns html.Pre object which contains the colorful representation of
-        the original source code.
+        the original source code. Large modules are rendered only partially,
+        in the window around the given line.
 
         Parameters
         ----------
         dash_id : str
             id of the html.Pre component
+        line : int, optional
+            number of the line (from 0) which shall be rendered (default is 0)
 
         Returns
         --------
@@ -269,7 +270,8 @@ class LuaCode:
             source code
         """
 
-        children = self.get_children(dash_id)
+        first_line, last_line = self.window(line)
+        children = self.get_children(dash_id, first_line, last_line)
 
         return html.Pre(
             id=dash_id,
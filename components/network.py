@@ -1,4 +1,5 @@
 import logging
+import numpy as np
 from sample import Sample
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
@@ -26,6 +27,9 @@ OUTPUT_WIDTH = 3
 # 40 is space for arrows
 LAYERS_LAYOUT_WIDTH = (4 * INPUT_WIDTH + 2 * LSTM1_WIDTH
                        + LSTM2_WIDTH + OUTPUT_WIDTH + 40)
+# hover info of 2D layers, customdata contains original y of the cell
+HOVER_TEMPLATE = ('x: %{x}<br>y: %{customdata}<br>value: %{z:.5~f}'
+                  '<extra></extra>')
 
 
 class Network:
@@ -114,38 +118,30 @@ class Network:
         col = 1
         for layer in self.sample.activations:
             # handle 1D layer
-            current_layer = self.sample.activations[layer][0].tolist()
+            current_layer = self.sample.activations[layer][0]
             shape = self.sample.activations[layer].shape
 
             if len(shape) < 3:
-
-                activations = [0 for _ in range(MAX_Y)]
-                y = [i for i in range(MAX_Y)]
-                x = [0 for _ in range(MAX_Y)]
-                text = [None for _ in range(MAX_Y)]
-                current_layer.reverse()
-
+                # each activation takes 3 cells, the layer is reversed so
+                # that y = 0 is at the top
                 index = 11 if layer == 3 else 92
-                for i, activation in enumerate(current_layer):
-                    activations[index] = activation
-                    activations[index + 1] = activation
-                    activations[index + 2] = activation
-                    text[index] = 'y: {}<br>value: {}'.format(
-                        len(current_layer) - 1 - i, activation)
-                    text[index + 1] = 'y: {}<br>value: {}'.format(
-                        len(current_layer) - 1 - i, activation)
-                    text[index + 2] = 'y: {}<br>value: {}'.format(
-                        len(current_layer) - 1 - i, activation)
-                    index += 3
+                end = index + 3 * len(current_layer)
+                values = current_layer[::-1].tolist()
+                activations = np.zeros(MAX_Y)
+                activations[index:end] = np.repeat(values, 3)
+                text = np.full(MAX_Y, None, dtype=object)
+                text[index:end] = np.repeat(
+                    ['y: {}<br>value: {}'.format(len(values) - 1 - i, value)
+                     for i, value in enumerate(values)], 3)
 
                 fig.add_trace(
                     go.Heatmap(
                         z=activations,
-                        x=x,
-                        y=y,
+                        x=np.zeros(MAX_Y, dtype=int),
+                        y=np.arange(MAX_Y),
                         zmin=-1,
                         zmax=1,
-                        hovertext=text,
+                        hovertext=text.tolist(),
                         showscale=False,
                         hoverinfo='text',
                         colorscale=RED_TO_BLUE
@@ -156,85 +152,37 @@ class Network:
                 col += 1
 
             else:
-                # split large 2D layers
-                first_half = current_layer[:MAX_Y]
-                second_half = current_layer[MAX_Y:]
-
-                # since we want y = 0 at the top af the heat map, original
-                # layer needs to be reversed
-                reversed_first_half = [
-                    first_half[i]
-                    for i in range(len(first_half) - 1, -1, -1)
-                ]
-
-                reversed_second_half = [
-                    second_half[i]
-                    for i in range(len(second_half) - 1, -1, -1)
-                ]
-
-                x = [i for i in range(len(first_half[0]))]
-                y = [i for i in range(len(first_half))]
-
-                text_first_half = [
-                    [None for _ in range(len(reversed_first_half[0]))]
-                    for _ in range(len(reversed_first_half))]
-
-                for i in range(len(reversed_first_half)):
-                    for j in range(len(reversed_first_half[0])):
-                        text_first_half[i][j] = (
-                            'x: {}<br>y: {}<br>value: {}'.format(
-                                j, MAX_Y - i - 1,
-                                round(reversed_first_half[i][j], 5)
-                            )
-                        )
-
-                text_second_half = [
-                    [None for _ in range(len(reversed_second_half[0]))]
-                    for _ in range(len(reversed_second_half))]
-
-                for i in range(len(reversed_second_half)):
-                    for j in range(len(reversed_second_half[0])):
-                        text_second_half[i][j] = (
-                            'x: {}<br>y: {}<br>value: {}'.format(
-                                j, 2 * MAX_Y - i - 1,
-                                round(reversed_second_half[i][j], 5)
-                            )
-                        )
-
-                fig.add_trace(
-                    go.Heatmap(
-                        z=reversed_first_half,
-                        x=x,
-                        y=y,
-                        hovertext=text_first_half,
-                        zmin=-2 if len(x) == INPUT_WIDTH else -1,
-                        zmax=2 if len(x) == INPUT_WIDTH else 1,
-                        showscale=False,
-                        hoverinfo='text',
-                        colorscale=RED_TO_BLUE,
-                    ),
-                    row=1,
-                    col=col
-                )
-                col += 1
-
-                fig.add_trace(
-                    go.Heatmap(
-                        z=reversed_second_half,
-                        x=x,
-                        y=y,
-                        hovertext=text_second_half,
-                        zmin=-2 if len(x) == INPUT_WIDTH else -1,
-                        zmax=2 if len(x) == INPUT_WIDTH else 1,
-                        showscale=False,
-                        hoverinfo='text',
-                        colorscale=RED_TO_BLUE,
-                    ),
-                    row=1,
-                    col=col
-                )
-
-                col += 1
+                # split large 2D layers, since we want y = 0 at the top af
+                # the heat map, the halves need to be reversed (as views
+                # of the original layer)
+                halves = [current_layer[:MAX_Y][::-1],
+                          current_layer[MAX_Y:][::-1]]
+
+                x = np.arange(shape[2])
+                y = np.arange(len(halves[0]))
+
+                for i, half in enumerate(halves):
+                    # original y of each cell for the hover info
+                    original_y = (i + 1) * MAX_Y - 1 - np.arange(len(half))
+                    custom_data = np.repeat(original_y[:, np.newaxis],
+                                            shape[2], axis=1)
+
+                    fig.add_trace(
+                        go.Heatmap(
+                            z=half,
+                            x=x,
+                            y=y,
+                            customdata=custom_data.astype(np.int16),
+                            hovertemplate=HOVER_TEMPLATE,
+                            zmin=-2 if len(x) == INPUT_WIDTH else -1,
+                            zmax=2 if len(x) == INPUT_WIDTH else 1,
+                            showscale=False,
+                            colorscale=RED_TO_BLUE,
+                        ),
+                        row=1,
+                        col=col
+                    )
+                    col += 1
 
             # insert arrow
             if layer != len(self.sample.activations) - 1:
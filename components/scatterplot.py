@@ -1,8 +1,8 @@
 import logging
 import json
 import urllib
-import chardet
 from constant import DIAGRAM_COLORS as COLORS
+from components.source import read_source_code
 import plotly.graph_objects as go
 import dash_core_components as dcc
 
@@ -38,14 +38,15 @@ class ScatterPlot:
         Returns dcc.Graph instance containing the scatterplot.
     """
 
-    def __init__(self, path=None, url=None, data=None):
+    def __init__(self, path=None, url=None, data=None, source_code=None):
         """
         According to the parameters given, the preprocessed data are read
         from JSON file (parameter path) or from the given url or
         simply copied from the given parameter data. If none of
         the parameters is provided, the function raises an error. Furthermore,
-        the original source code is read and the attribute traces is
-        initialized.
+        the original source code is read (unless it's provided) and
+        the attribute traces is built, so the figure can be created
+        repeatedly.
 
         Parameters
         ----------
@@ -57,6 +58,8 @@ class ScatterPlot:
             (default is None)
         data : dict or None, optional
             preprocessed data already read from JSON file
+        source_code : str or None, optional
+            original source code already read for the data (default is None)
         """
 
         if data:
@@ -75,7 +78,10 @@ class ScatterPlot:
                 with urllib.request.urlopen(url) as url_data:
                     self.data = json.loads(url_data.read().decode())
 
-        self.source_code = self.__read_source_code()
+        if source_code is None:
+            self.source_code = read_source_code(self.data)
+        else:
+            self.source_code = source_code
         self.traces = {
             'require': {
                 'x': list(),
@@ -109,31 +115,8 @@ class ScatterPlot:
             }
         }
 
-    def __read_source_code(self) -> str:
-        """
-        Reads and returns LUA source code from path or url from the data.
-
-        Returns
-        --------
-        str
-            original LUA source code which was preprocessed and stored in
-            JSON file
-        """
-
-        # if there's path provided read form it, otherwise read from url
-        if self.data['path']:
-            raw_data = open(self.data['path'], 'rb').read()
-
-        else:
-            log.debug('Loading module file from {}'.format(self.data['url']))
-            url_file = urllib.request.urlopen(self.data['url'])
-            raw_data = url_file.read()
-
-        chardet_result = chardet.detect(raw_data)
-        if chardet_result['encoding'] not in ['ascii', 'utf-8']:
-            raw_data = raw_data.decode('iso-8859-1').encode('utf-8')
-
-        return raw_data.decode('utf-8')
+        for node in self.data['nodes']:
+            self.__add_node_to_trace(node)
 
     def __add_node_to_trace(self, node: dict):
         """
@@ -180,9 +163,6 @@ class ScatterPlot:
             of the source code)
         """
 
-        for node in self.data['nodes']:
-            self.__add_node_to_trace(node)
-
         for trace in self.traces:
             fig.add_trace(
                 go.Scatter(
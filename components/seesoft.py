@@ -1,11 +1,17 @@
+import os
 import logging
 import json
 import urllib
-import chardet
 from PIL import Image
-from PIL import ImageDraw
+from PIL import ImageColor
 from constant import COLORS
 from constant import LUA_LINE_HEIGHT
+from components.tagtable import TagTable
+from components.tagtable import CONTAINERS
+from components.tagtable import CODES
+from components.cache import LRUCache
+from components.source import read_source_code
+import numpy as np
 import plotly.graph_objects as go
 import base64
 from io import BytesIO
@@ -21,11 +27,21 @@ MAX_VIEW_HEIGHT = 750
 MAX_SMALL_VIEW_WIDTH = 230
 MIN_SMALL_VIEW_HEIGHT = 200
 MAX_SMALL_VIEW_HEIGHT = 650
+# maximum size (in bytes) of the images and figures cached in the memory
+RENDER_CACHE_SIZE = 256 * 2 ** 20
+# directory where the cached images and figures evicted from the memory are
+# spilled, if None they're dropped
+RENDER_CACHE_DIR = None
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 log.addHandler(logging.StreamHandler())
 
+# images and figures rendered for the JSON files, shared by all callbacks,
+# paths to the source code files are cached there as well, so the JSON file
+# doesn't have to be read to build the cache key
+render_cache = LRUCache(RENDER_CACHE_SIZE, spill_dir=RENDER_CACHE_DIR)
+
 
 class SeeSoft:
     """
@@ -46,9 +62,9 @@ class SeeSoft:
     source_code : str
         read original source code, structure of which is represented in
         the attribute data
-    tag_table : list of dict
-        dict for each character from the source code, each dict consists of
-        the character and the type of the statement (require, variable etc.)
+    tag_table : TagTable
+        the type of the statement (require, variable etc.) assigned to each
+        character from the source code
     bin_img :
         binary representation of the small colorful image of the original
         source code
@@ -78,14 +94,14 @@ class SeeSoft:
         of the LUA source code.
     """
 
-    def __init__(self, path=None, url=None, data=None):
+    def __init__(self, path=None, url=None, data=None, tag_table=None):
         """
         According to the parameters given, the preprocessed data are read
         from JSON file (parameter path) or from the given url or
         simply copied from the given parameter data. If none of
         the parameters is provided, the function raises an error. Furthermore,
-        the original source code is read, tag_table is built and all
-        the other attributes are initialized.
+        the original source code is read, tag_table is built (unless it's
+        provided) and all the other attributes are initialized.
 
         Parameters
         ----------
@@ -97,6 +113,9 @@ class SeeSoft:
             (default is None)
         data : dict or None, optional
             preprocessed data already read from JSON file
+        tag_table : TagTable or None, optional
+            tag table already built for the same data, e.g. shared with
+            LuaCode (default is None)
         """
 
         if data:
@@ -116,301 +135,234 @@ class SeeSoft:
         self.byte_width = BYTE_WIDTH
         self.byte_height = BYTE_HEIGHT
         self.margin_size = MARGIN_SIZE
-        self.source_code = self.__read_source_code()
-        self.tag_table = [dict() for _ in range(len(self.source_code))]
+        if tag_table is not None:
+            self.source_code = tag_table.source_code
+            self.tag_table = tag_table
+        else:
+            self.source_code = read_source_code(self.data)
+            self.tag_table = TagTable(self.data, self.source_code)
         self.bin_img = BytesIO()
 
-        self.__build_tag_table()
         self.img_width = ((self.__max_line() * self.byte_width)
                           + 2 * self.margin_size)
         self.img_height = ((self.__lines_count() * self.byte_height)
                            + 2 * self.margin_size)
 
-    def __read_source_code(self) -> str:
+    def __max_line(self) -> int:
         """
-        Reads and returns LUA source code from path or url given in the data.
+        Counts the length (in characters) of the longest line of the LUA
+        source code.
 
         Returns
-        --------
-        str
-            original LUA source code which was preprocessed and stored in
-            JSON file
+        -------
+        int
+            length of the longest line of the LUA source code
         """
 
-        # if there's path provided read form it, otherwise read from url
-        if self.data['path']:
-            raw_data = open(self.data['path'], 'rb').read()
+        chars = self.tag_table.chars
+        newlines = chars == '\n'
+        lines_count = np.count_nonzero(newlines)
+        if not lines_count:
+            return 0
 
-        else:
-            log.debug('Loading module file from {}'.format(self.data['url']))
-            url_file = urllib.request.urlopen(self.data['url'])
-            raw_data = url_file.read()
-
-        chardet_result = chardet.detect(raw_data)
-        if chardet_result['encoding'] not in ['ascii', 'utf-8']:
-            raw_data = raw_data.decode('iso-8859-1').encode('utf-8')
+        # '\t' is 4 characters wide, only lines ended by '\n' are counted
+        widths = np.where(chars == '\t', 4, 1)
+        widths[newlines] = 0
+        line_ids = np.cumsum(newlines) - newlines
+        lengths = np.bincount(line_ids, weights=widths,
+                              minlength=lines_count + 1)
 
-        return raw_data.decode('utf-8')
+        return int(lengths[:lines_count].max())
 
-    def __add_color(self, node: dict):
+    def __lines_count(self) -> int:
         """
-        Adds color to the tag_table for each character included in the given
-        node. Colors are assigned according to the container type of the node.
+        Counts the number of lines of the LUA source code.
 
-        Parameters
-        ----------
-        node : dict
-            information about the node such as type of container (type of
-            statement), order in the source code, number of the children etc.
+        Returns
+        -------
+        int
+            number of lines of the LUA source code
         """
 
-        position = node['position'] - 1
-        for i in range(position, position + node['characters_count']):
-            self.tag_table[i]['container'] = node['container']
-            self.tag_table[i]['char'] = self.source_code[i]
-
-            if 'children' in node:
-                for child in node['children']:
-                    self.__add_color(child)
+        return 1 + int(np.count_nonzero(self.tag_table.chars == '\n'))
 
-    def __build_tag_table(self):
+    def __positions(self) -> (np.ndarray, np.ndarray):
         """
-        Builds tag_table so that every character from source file has color
-        assigned according to the container type.
-        """
-
-        # assign container to each character form source code
-        for node in self.data['nodes']:
-            self.__add_color(node)
+        Computes the row and the column of each character of the source code
+        (without '\\r'), '\\t' is 4 columns wide.
 
-        # add None container to characters which don't belong anywhere
-        for i, byte in enumerate(self.tag_table):
-            if not byte:
-                byte['container'] = None
-                byte['char'] = self.source_code[i]
+        Returns
+        -------
+        np.ndarray, np.ndarray
+            rows and columns of the characters
+        """
 
-            if byte['char'] == '\n':
-                byte['container'] = None
+        chars = self.tag_table.chars
+        newlines = chars == '\n'
 
-        # remove '\r'
-        self.tag_table = list(
-            filter(lambda b: b['char'] != '\r', self.tag_table)
-        )
+        widths = np.where(chars == '\t', 4, 1)
+        widths[newlines] = 0
+        rows = np.cumsum(newlines) - newlines
+        offsets = np.cumsum(widths) - widths
+        line_starts = np.concatenate(([0], offsets[newlines]))
 
-        # add comments and other code segments which don't belong to any
-        # container to 'comment' container
-        for byte in self.tag_table:
-            if not byte['container'] and not byte['char'].isspace():
-                byte['container'] = 'comment'
-
-        # make spaces in comments colorful instead of white
-        for i, byte in enumerate(self.tag_table):
-            if (
-                    byte['char'] == ' '
-                    and i - 1 >= 0
-                    and i + 1 < len(self.tag_table)
-                    and self.tag_table[i - 1]['container'] == 'comment'
-                    and (self.tag_table[i + 1]['container'] == 'comment'
-                         or self.tag_table[i + 1]['char'].isspace())
-            ):
-                byte['container'] = 'comment'
-
-        # handle white spaces in the beginning of the line
-        # it's about keeping tabs white in the final image
-        for i, byte in enumerate(self.tag_table):
-            if byte['char'] == '\n':
-                j = i + 1
-
-                while (j < len(self.tag_table) and
-                       self.tag_table[j]['char'].isspace()):
-                    self.tag_table[j]['container'] = None
-                    j += 1
+        return rows, offsets - line_starts[rows]
 
-    def __max_line(self) -> int:
+    def __cells(self) -> np.ndarray:
         """
-        Counts the length (in characters) of the longest line of the LUA
-        source code.
+        Computes the cell (row and column) of each character of the source
+        code, '\\t' takes 4 cells, and assigns the type of the statement to
+        the cells.
 
         Returns
         -------
-        int
-            length of the longest line of the LUA source code
+        np.ndarray
+            array with one element for each character cell, 0 for the cells
+            without character, otherwise the code of the container (index to
+            CONTAINERS) increased by 1
         """
 
-        max_len = 0
-        local_len = 0
-
-        for byte in self.tag_table:
-            if byte['char'] == '\n':
-                if local_len > max_len:
-                    max_len = local_len
-                local_len = 0
-            elif byte['char'] == '\t':
-                local_len += 4
-            else:
-                local_len += 1
-
-        return max_len
-
-    def __lines_count(self) -> int:
+        chars = self.tag_table.chars
+        newlines = chars == '\n'
+        tabs = chars == '\t'
+        rows, columns = self.__positions()
+
+        # cells out of the image are not needed
+        rows_count = min(self.__lines_count(),
+                         (self.img_height - self.margin_size)
+                         // self.byte_height + 1)
+        columns_count = ((self.img_width - self.margin_size)
+                         // self.byte_width + 1)
+        cells = np.zeros((rows_count, columns_count), dtype=np.uint8)
+
+        painted = ~newlines
+        values = self.tag_table.containers + np.uint8(1)
+        for offset in range(4):
+            # all characters occupy the first cell, only '\t' the other ones
+            if offset:
+                painted &= tabs
+            mask = (painted & (columns + offset < columns_count)
+                    & (rows < rows_count))
+            cells[rows[mask], columns[mask] + offset] = values[mask]
+
+        return cells
+
+    def __pixels(self, cells: np.ndarray, size: int, axis: int) -> np.ndarray:
         """
-        Counts the number of lines of the LUA source code.
+        Scales the cells to the pixels along the given axis with nearest
+        neighbour resize. Rectangles of the cells include their right (bottom)
+        border, so the pixels on the border between two cells belong to
+        the later drawn one, i.e. the right (bottom) one if it's not empty.
+
+        Parameters
+        ----------
+        cells : np.ndarray
+            cells or already scaled cells, 0 means empty cell
+        size : int
+            size of the cell along the axis in pixels
+        axis : int
+            axis which is scaled
 
         Returns
         -------
-        int
-            number of lines of the LUA source code
+        np.ndarray
+            cells scaled to the size of the image along the axis
         """
 
-        count = 1
+        length = self.img_width if axis == 1 else self.img_height
+        pixels = np.arange(length) - self.margin_size
+        # cells are shifted by one, so that the empty cell with index 0
+        # can be used outside of the cells
+        count = cells.shape[axis]
+        padded = np.pad(cells, [(1, 1) if i == axis else (0, 0)
+                                for i in range(cells.ndim)])
+        current = np.clip(pixels // size + 1, 0, count + 1)
+        previous = np.clip(pixels // size, 0, count + 1)
 
-        for byte in self.tag_table:
-            if byte['char'] == '\n':
-                count += 1
+        scaled = np.take(padded, current, axis=axis)
+        border = np.take(padded, previous, axis=axis)
+        border_pixels = pixels % size == 0
+        if axis == 0:
+            border_pixels = border_pixels[:, None]
 
-        return count
+        return np.where((scaled == 0) & border_pixels, border, scaled)
 
     def draw(self):
         """
-        Creates the image representation of the source code. The image is
-        stored in self.bin_image.
+        Creates the image representation of the source code. Each character
+        has a rectangle in the image (4 rectangles for '\\t') colored
+        according to its type of statement. The image is stored in
+        self.bin_image.
         """
 
-        image = Image.new('RGB', (self.img_width, self.img_height),
-                          color=COLORS['empty'])
-        draw = ImageDraw.Draw(image)
+        palette = [COLORS['empty']] + [COLORS[container or 'empty']
+                                       for container in CONTAINERS]
 
-        row = 0
-        column = 0
-        for byte in self.tag_table:
-
-            if byte['char'] == '\n':
-                row += 1
-                column = 0
-            elif byte['char'] == '\t':
-                # when the character is '\t' just write rectangle of size 4
-                x = self.margin_size + column * self.byte_width
-                y = self.margin_size + row * self.byte_height
-
-                draw.rectangle(
-                    (x, y, x + 4 * self.byte_width, y + self.byte_height),
-                    fill=COLORS[byte['container'] or 'empty']
-                )
-
-                column += 4
-            else:
-                x = self.margin_size + column * self.byte_width
-                y = self.margin_size + row * self.byte_height
-
-                draw.rectangle(
-                    (x, y, x + self.byte_width, y + self.byte_height),
-                    fill=COLORS[byte['container'] or 'empty']
-                )
-
-                column += 1
+        pixels = self.__pixels(self.__cells(), self.byte_width, axis=1)
+        pixels = self.__pixels(pixels, self.byte_height, axis=0)
 
+        # palette image is much faster to encode than RGB image and it has
+        # the same colors
+        image = Image.fromarray(pixels)
+        image.putpalette([value for color in palette
+                          for value in ImageColor.getrgb(color)])
         image.save(self.bin_img, format='PNG')
 
     def __add_traces(self, fig):
         """
-        Adds invisible traces to the graph for each statement. These traces
-        shall be later used for easier navigation through the luacode
-        visualization.
+        Adds invisible trace to the graph with a point for each character of
+        the statements. The trace shall be later used for easier navigation
+        through the luacode visualization.
 
         Parameters
         ----------
         fig : go.Figure
-            instance of go.Figure where the traces are added and where
+            instance of go.Figure where the trace is added and where
             the image stored in self.bin_image shall be set as background
         """
 
-        # NOTE: first line from the file has the highest y value in the graph
-        row = self.__lines_count() - self.margin_size / self.byte_height + 1
-        column = 0
+        chars = self.tag_table.chars
+        containers = self.tag_table.containers
+        rows, columns = self.__positions()
+        lines_count = self.__lines_count()
+
+        # every character with container is represented by a point
+        points = ((containers != CODES[None]) & (chars != '\n')
+                  & (chars != '\t'))
         # id of the corresponding section from lua code can be determined
-        # with section number
-        section_num = 1
-        x = list()
-        y = list()
-        # position in pixels for later scroll interaction
-        custom_data = list()
-        # id of line in lua code, which is represented by particular trace
-        text = list()
-
-        for i, byte in enumerate(self.tag_table):
-            # when moving to the next line, add the accumulated trace to
-            # the figure and clear the trace
-            if byte['char'] == '\n':
-                fig.add_trace(
-                    go.Scatter(
-                        x=x,
-                        y=y,
-                        customdata=custom_data,
-                        text=text,
-                        mode='markers',
-                        marker_opacity=0,
-                        hoverinfo='none'
-                    )
-                )
-
-                row -= 1
-                column = 0
-                x.clear()
-                y.clear()
-                custom_data.clear()
-                text.clear()
-
-            elif byte['char'] == '\t':
-                # when the character is '\t' shift the beginning of the trace
-                column += 4
-
-            elif byte['container'] is not None:
-                # add point representing character to the trace
-                x.append(
-                    self.margin_size
-                    + column * self.byte_width
-                    + self.byte_width * 0.5
-                )
-
-                y.append(
-                    self.margin_size
-                    + row * self.byte_height
-                    + self.byte_height * 0.5
-                )
-
-                custom_data.append(
-                    # without margin size so that there's some space above
-                    # the chosen line
-                    (self.__lines_count() - row - 2) * LUA_LINE_HEIGHT
-                )
-
-                text.append(section_num)
-
-                column += 1
-                # increment section number when the container has changed
-                if (
-                        i > 0 and
-                        byte['container'] != self.tag_table[i - 1]['container']
-                ):
-                    section_num += 1
+        # with section number, which is incremented after each point where
+        # the container has changed
+        changes = np.zeros(len(containers), dtype=bool)
+        changes[1:] = containers[1:] != containers[:-1]
+        increments = points & changes
+        sections = 1 + np.cumsum(increments) - increments
 
-            else:
-                column += 1
-
-        # the text might not end with '\n', therefore last trace might not
-        # have been added at this point
-        if x and y:
-            fig.add_trace(
-                go.Scatter(
-                    x=x,
-                    y=y,
-                    customdata=custom_data,
-                    text=text,
-                    mode='markers',
-                    marker_opacity=0,
-                    hoverinfo='none'
-                )
+        # NOTE: first line from the file has the highest y value in the graph
+        rows = (lines_count - self.margin_size / self.byte_height + 1
+                - rows[points])
+        columns = columns[points]
+
+        # all points are in one trace with compact arrays, so that
+        # the figure is small
+        fig.add_trace(
+            go.Scatter(
+                x=(self.margin_size + columns * self.byte_width
+                   + self.byte_width * 0.5).astype(np.float32),
+                y=(self.margin_size + rows * self.byte_height
+                   + self.byte_height * 0.5).astype(np.float32),
+                # position in pixels for later scroll interaction, without
+                # margin size so that there's some space above the chosen
+                # line
+                customdata=((lines_count - rows - 2)
+                            * LUA_LINE_HEIGHT).astype(np.int32),
+                # id of section in lua code, which is represented by
+                # particular point
+                text=sections[points].tolist(),
+                mode='markers',
+                marker_opacity=0,
+                hoverinfo='none'
             )
+        )
 
     def count_small_width_and_height(self, width: int or str,
                                      height: int or str):
@@ -606,3 +558,62 @@ class SeeSoft:
                 'max-height': '750px'
             }
         )
+
+
+def cached_figure(path: str, small=False, data=None, tag_table=None) -> dict:
+    """
+    Returns figure of SeeSoft visualization of the given JSON file as dict.
+    Figures and images are cached, keyed by the JSON file, the source code
+    file with their modification times and the variant (small or large),
+    so the visualization is drawn again only if some of the files changes.
+
+    Parameters
+    ----------
+    path : str
+        path to the JSON file, which contains preprocessed LUA source code
+    small : bool, optional
+        determines the size of the figure (default is False)
+    data : dict or None, optional
+        preprocessed data already read from the JSON file (default is None)
+    tag_table : TagTable or None, optional
+        tag table already built for the same data (default is None)
+
+    Returns
+    -------
+    dict
+        figure containing the colorful representation of the source code
+    """
+
+    json_key = (os.path.realpath(path), os.path.getmtime(path))
+    # path is wrapped in the tuple, since it may be None
+    cached_source_path = render_cache.get(json_key + ('source', ))
+    if cached_source_path is None:
+        if data is None:
+            with open(path) as f:
+                data = json.load(f)
+        cached_source_path = (data['path'], )
+        render_cache.put(json_key + ('source', ), cached_source_path)
+
+    source_path, = cached_source_path
+    if source_path and os.path.exists(source_path):
+        key = json_key + (source_path, os.path.getmtime(source_path))
+    else:
+        key = json_key + (source_path, None)
+
+    figure_key = key + ('small' if small else 'large', )
+    figure = render_cache.get(figure_key)
+    if figure is not None:
+        return figure
+
+    seesoft = SeeSoft(path=path, data=data, tag_table=tag_table)
+    image = render_cache.get(key + ('png', ))
+    if image is None:
+        seesoft.draw()
+        render_cache.put(key + ('png', ), seesoft.bin_img.getvalue())
+    else:
+        seesoft.bin_img = BytesIO(image)
+
+    figure = seesoft.get_figure(small=small).to_dict()
+    render_cache.put(figure_key, figure)
+
+    return figure
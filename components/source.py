@@ -0,0 +1,50 @@
+"""
+Module for reading the original LUA source codes of the preprocessed data.
+Decoded source codes are cached, so the components visualizing the same
+sample (or the samples compared repeatedly) read each file just once.
+"""
+
+import os
+import logging
+import urllib.request
+from components.cache import LRUCache
+
+# maximum size (in bytes) of the cached source codes
+SOURCE_CACHE_SIZE = 64 * 2 ** 20
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+# decoded source codes keyed by the path, modification time and size of
+# the file
+source_cache = LRUCache(SOURCE_CACHE_SIZE)
+
+
+# decodes source code as strict UTF-8 (ASCII included), other files are
+# decoded as ISO-8859-1, which keeps one character for each byte
+def decode_source_code(raw_data: bytes) -> str:
+    try:
+        return raw_data.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw_data.decode('iso-8859-1')
+
+
+# returns LUA source code from path or url from the data, source codes read
+# from path are cached until the file changes
+def read_source_code(data: dict) -> str:
+    # if there's path provided read form it, otherwise read from url
+    if not data['path']:
+        log.debug('Loading module file from {}'.format(data['url']))
+        with urllib.request.urlopen(data['url']) as url_file:
+            return decode_source_code(url_file.read())
+
+    stat = os.stat(data['path'])
+    key = (os.path.realpath(data['path']), stat.st_mtime, stat.st_size)
+    source_code = source_cache.get(key)
+    if source_code is None:
+        with open(data['path'], 'rb') as f:
+            source_code = decode_source_code(f.read())
+        source_cache.put(key, source_code)
+
+    return source_code
@@ -0,0 +1,194 @@
+import numpy as np
+from typing import List, Tuple
+
+
+# container types which can be assigned to the characters, the position
+# in the tuple is the code stored in TagTable.containers
+CONTAINERS = (None, 'require', 'variable', 'function', 'interface', 'other',
+              'comment')
+CODES = {container: code for code, container in enumerate(CONTAINERS)}
+COMMENT = CODES['comment']
+
+
+class TagTable:
+    """
+    Class assigning the type of the statement (container) to every character
+    of the source code. The table is shared by the components visualizing
+    the source code (LuaCode and SeeSoft), so the source code is tagged just
+    once for each sample.
+
+    Attributes
+    ----------
+    source_code : str
+        original source code, structure of which is represented in the data
+    text : str
+        source code without '\\r' characters, i-th character of the text
+        belongs to the i-th element of the table
+    chars : np.ndarray
+        array of the characters of the text
+    containers : np.ndarray
+        uint8 array of the codes of the containers (indices to CONTAINERS)
+        assigned to the characters of the text
+
+    Methods
+    -------
+    container(i)
+        Returns type of the statement assigned to the i-th character.
+    runs()
+        Returns list of the adjoining sections of the text with the same type
+        of the statement.
+    """
+
+    def __init__(self, data: dict, source_code: str):
+        """
+        Builds the table so that every character from source code has
+        the container assigned.
+
+        Parameters
+        ----------
+        data : dict
+            pre-processed data read from the JSON file
+        source_code : str
+            original source code, structure of which is represented in
+            the data
+        """
+
+        self.source_code = source_code
+        # characters as unicode code points, so that the array can be viewed
+        # as an array of strings of length 1
+        codes = np.frombuffer(source_code.encode('utf-32-le'),
+                              dtype=np.uint32)
+        containers = np.zeros(len(codes), dtype=np.uint8)
+
+        # assign container to each character form source code
+        for node in data['nodes']:
+            self.__add_color(containers, node)
+
+        # characters which don't belong anywhere and '\n' have no container
+        containers[codes == ord('\n')] = CODES[None]
+
+        # remove '\r'
+        kept = codes != ord('\r')
+        self.chars = codes[kept].view('<U1')
+        self.containers = containers[kept]
+        self.text = source_code.replace('\r', '')
+
+        self.__add_comments()
+
+    @staticmethod
+    def __add_color(containers: np.ndarray, node: dict):
+        """
+        Assigns the container of the given node to all characters of
+        the node and its descendants. Each node is visited just once in
+        pre-order, so that the children overwrite their parents, and its
+        characters are assigned at once, so the time is linear in the total
+        length of the nodes. Nodes are kept on the stack instead of recursion,
+        so deeply nested trees don't hit the recursion limit.
+
+        Parameters
+        ----------
+        containers : np.ndarray
+            codes of the containers assigned to the characters of the source
+            code
+        node : dict
+            information about the node such as type of container (type of
+            statement), order in the source code, number of the children etc.
+        """
+
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            # children of empty node are never visited
+            if node['characters_count'] <= 0:
+                continue
+
+            position = node['position'] - 1
+            containers[position:position + node['characters_count']] = (
+                CODES[node['container']])
+
+            if 'children' in node:
+                stack.extend(reversed(node['children']))
+
+    def __add_comments(self):
+        """
+        Assigns 'comment' container to the parts of the text which don't
+        belong to any container and handles white spaces in comments and
+        in the beginning of the lines.
+        """
+
+        containers = self.containers
+        indices = np.arange(len(containers))
+        spaces = np.char.isspace(self.chars)
+
+        # add comments and other code segments which don't belong to any
+        # container to 'comment' container
+        containers[(containers == CODES[None]) & ~spaces] = COMMENT
+
+        # make spaces in comments colorful instead of white, space is
+        # colorful if it follows colorful comment (or colorful space) and
+        # it's followed by comment or other white space
+        next_comment = np.zeros(len(containers), dtype=bool)
+        next_comment[:-1] = (containers[1:] == COMMENT) | spaces[1:]
+        candidates = (self.chars == ' ') & next_comment
+        candidates[:1] = False
+
+        # each sequence of candidates becomes colorful when there is
+        # a comment at its beginning (or right before it)
+        comments = containers == COMMENT
+        last_comment = np.maximum.accumulate(np.where(comments, indices, -1))
+        sequence_start = np.maximum.accumulate(
+            np.where(~candidates, indices, -1))
+        colorful = np.zeros(len(containers), dtype=bool)
+        colorful[1:] = (last_comment[:-1] >= sequence_start[:-1])
+        containers[candidates & colorful] = COMMENT
+
+        # handle white spaces in the beginning of the line
+        # it's about keeping tabs white in the final image
+        last_newline = np.maximum.accumulate(
+            np.where(self.chars == '\n', indices, -1))
+        last_text = np.maximum.accumulate(np.where(~spaces, indices, -1))
+        leading = np.zeros(len(containers), dtype=bool)
+        leading[1:] = last_newline[:-1] > last_text[:-1]
+        containers[spaces & leading] = CODES[None]
+
+    def __len__(self) -> int:
+        return len(self.containers)
+
+    def container(self, i: int) -> str or None:
+        """
+        Returns type of the statement assigned to the i-th character.
+
+        Parameters
+        ----------
+        i : int
+            index of the character in the text
+
+        Returns
+        -------
+        str or None
+            type of the statement (require, variable etc.) or None
+        """
+
+        return CONTAINERS[self.containers[i]]
+
+    def runs(self) -> List[Tuple[str, str or None]]:
+        """
+        Returns list of the adjoining sections of the text with the same type
+        of the statement.
+
+        Returns
+        -------
+        list of tuple
+            text of the section and its type of the statement for each
+            section in the order from the beginning of the text
+        """
+
+        if not len(self.containers):
+            return list()
+
+        starts = np.flatnonzero(np.diff(self.containers)) + 1
+        starts = [0] + starts.tolist()
+        ends = starts[1:] + [len(self.containers)]
+
+        return [(self.text[start:end], CONTAINERS[self.containers[start]])
+                for start, end in zip(starts, ends)]
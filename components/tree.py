@@ -1,16 +1,30 @@
+import os
 import logging
 import json
 import urllib
+import numpy as np
 from igraph import Graph
 import plotly.graph_objects as go
 from constant import DIAGRAM_COLORS as COLORS
+from components.cache import LRUCache
 import dash_core_components as dcc
 
+# maximum size (in bytes) of the cached tree layouts
+LAYOUT_CACHE_SIZE = 64 * 2 ** 20
+# trees with more nodes are displayed only up to the depth, where the number
+# of displayed nodes fits in MAX_NODES, deeper subtrees are aggregated
+MAX_NODES = 1500
+# figures with more nodes are rendered with WebGL
+GL_NODES = 1000
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 log.addHandler(logging.StreamHandler())
 
+# layouts of the trees keyed by the path to the JSON file and its
+# modification time, AST in the file never changes otherwise
+layout_cache = LRUCache(LAYOUT_CACHE_SIZE)
+
 
 class Tree:
     """
@@ -18,10 +32,15 @@ class Tree:
 
     Attributes
     ----------
+    path : str or None
+        path to the JSON file, None if the data weren't read from the file
     data : dict
         pre-processed data read from the JSON file
-    edges : list
-        list of edges of the AST
+    edges : np.ndarray
+        array of edges (pairs of master indices) of the AST
+    positions : np.ndarray
+        positions of the nodes in the layout computed by Reingold-Tilford
+        algorithm, one row for each node
     colors : list
         list of colors as they are assigned to each node of the tree, colors
         are assigned according to the type of statement that the nodes
@@ -29,10 +48,25 @@ class Tree:
     text : list
         list of the texts (parts of the source code) which are contained within
         the nodes
+    parents : np.ndarray
+        master index of the parent of each node (-1 for the root)
+    depths : np.ndarray
+        depth of each node, the root has depth 0
+    subtree_sizes : np.ndarray
+        number of nodes in the subtree of each node (including the node)
+    dominant_colors : np.ndarray
+        the most frequent color in the subtree of each node
+    max_depth : int or None
+        depth of the nodes in the last figure, whose subtrees are aggregated
+        (unless they're expanded)
+    expanded : set
+        master indices of the aggregated nodes which were expanded
 
     Methods
     -------
-    get_figure(horizontal=False)
+    expand(node)
+        Expands the aggregated node, so that its children are displayed.
+    get_figure(horizontal=False, max_nodes=MAX_NODES, max_depth=None)
         Returns go.Figure instance containing the tree diagram representing
         the AST of the source code.
     view(dash_id, horizontal=False, height=None)
@@ -46,7 +80,8 @@ class Tree:
         from JSON file (parameter path) or from the given url or
         simply copied from the given parameter data. If none of
         the parameters is provided, the function raises an error. Furthermore,
-        other attributes are initialized.
+        the layout of the tree is computed (or taken from the cache if
+        the data are read from path) and other attributes are initialized.
 
         Parameters
         ----------
@@ -57,9 +92,11 @@ class Tree:
             url of the JSON file, which contains preprocessed LUA source code
             (default is None)
         data : dict or None, optional
-            preprocessed data already read from JSON file
+            preprocessed data already read from JSON file, if path is given
+            as well, it's used just as the key for the cached layout
         """
 
+        self.path = path
         if data:
             self.data = data
         else:
@@ -74,110 +111,302 @@ class Tree:
                 with urllib.request.urlopen(url) as url_data:
                     self.data = json.loads(url_data.read().decode())
 
-        # all edges between nodes
-        self.edges = list()
-        # color for each node
-        self.colors = ([COLORS['plot-line']]
-                       + ['' for _ in range(self.data['nodes_count'])])
-        # text for each node
-        self.text = ['root'] + ['' for _ in range(self.data['nodes_count'])]
+        key = None
+        if path:
+            key = (os.path.realpath(path), os.path.getmtime(path))
+            layout = layout_cache.get(key)
+        else:
+            layout = None
+
+        if layout is None:
+            layout = self.__build_layout()
+            if key:
+                layout_cache.put(key, layout)
+
+        self.edges = layout['edges']
+        self.positions = layout['positions']
+        self.colors = layout['colors']
+        self.text = layout['text']
+
+        self.parents, self.depths = self.__build_hierarchy()
+        self.subtree_sizes, self.dominant_colors = self.__aggregate_subtrees()
+        self.max_depth = None
+        self.expanded = set()
 
-    def __add_child_edges(self, node: dict):
+    def __add_child_edges(self, node: dict, layout: dict):
         """
-        Builds attributes edges, colors and text so that the tree diagram can
-        be created later.
+        Adds edges from the node to its children (and their descendants)
+        together with their colors and texts to the layout.
 
         Parameters
         ----------
         node : dict
             node read from the JSON file containing all the properties such as
             container type, children etc.
+        layout : dict
+            edges, colors and texts of the nodes
         """
 
         for child in node['children']:
-            self.edges.append((node['master_index'], child['master_index']))
-            self.colors[child['master_index']] = COLORS[child['container']]
-            self.text[child['master_index']] = '({}, {})'.format(
+            layout['edges'].append((node['master_index'],
+                                    child['master_index']))
+            layout['colors'][child['master_index']] = (
+                COLORS[child['container']])
+            layout['text'][child['master_index']] = '({}, {})'.format(
                 child['master_index'], child['container'])
 
             if 'children' in child:
-                self.__add_child_edges(child)
+                self.__add_child_edges(child, layout)
 
-    def get_figure(self, horizontal=False) -> go.Figure:
+    def __build_layout(self) -> dict:
         """
-        Returns a figure containing tree diagram representing the AST of
-        the source code.
-
-        Parameters
-        ----------
-        horizontal : bool, optional
-            determines, whether the tree should be oriented horizontally or
-            vertically (default is False)
+        Builds edges, colors and texts of the nodes and computes layout of
+        the tree with Reingold-Tilford algorithm.
 
         Returns
         -------
-        go.Figure
-            go.Figure instance containing the tree diagram representing
-            the AST of the source code
+        dict
+            array of the edges, array of the node positions, list of colors
+            and list of texts for each node
         """
 
         # nodes from .json plus root node
         nodes_count = self.data['nodes_count'] + 1
+        layout = {
+            # all edges between nodes
+            'edges': list(),
+            # color for each node
+            'colors': [COLORS['plot-line']] + ['' for _ in
+                                               range(nodes_count - 1)],
+            # text for each node
+            'text': ['root'] + ['' for _ in range(nodes_count - 1)]
+        }
 
         # edges from root to the nodes of depth 1
         for node in self.data['nodes']:
-            self.edges.append((0, node['master_index']))
-            self.colors[node['master_index']] = COLORS[node['container']]
-            self.text[node['master_index']] = '({}, {})'.format(
+            layout['edges'].append((0, node['master_index']))
+            layout['colors'][node['master_index']] = COLORS[node['container']]
+            layout['text'][node['master_index']] = '({}, {})'.format(
                 node['master_index'], node['container'])
 
             # all other edges to child nodes
             if 'children' in node:
-                self.__add_child_edges(node)
+                self.__add_child_edges(node, layout)
 
-        graph = Graph(n=self.data['nodes_count'] + 1, directed=True)
-        graph.add_edges(self.edges)
+        graph = Graph(n=nodes_count, directed=True)
+        graph.add_edges(layout['edges'])
 
         # build layout with Reingold-Tilford algorithm
-        layout = graph.layout_reingold_tilford(mode='out', root=[0])
-        # node positions in graph
-        positions = {k: layout[k] for k in range(nodes_count)}
-        max_y = max([layout[k][1] for k in range(nodes_count)])
-
-        # count node and edge positions and switch original x and y
-        # coordinates so that tree would branch horizontally
-        nodes_x = [2 * max_y - positions[k][1] for k in range(len(positions))]
-        nodes_y = [positions[k][0] for k in range(len(positions))]
-        edges_x = list()
-        edges_y = list()
-
-        for edge in self.edges:
-            edges_y += [positions[edge[0]][0], positions[edge[1]][0], None]
-            edges_x += [2 * max_y - positions[edge[0]][1],
-                        2 * max_y - positions[edge[1]][1], None]
+        positions = graph.layout_reingold_tilford(mode='out', root=[0])
+        layout['positions'] = np.array(positions.coords,
+                                       dtype=float).reshape(nodes_count, 2)
+        layout['edges'] = np.array(layout['edges'],
+                                   dtype=int).reshape(-1, 2)
+
+        return layout
+
+    def __build_hierarchy(self) -> (np.ndarray, np.ndarray):
+        """
+        Finds parent and depth of each node from the edges.
+
+        Returns
+        -------
+        np.ndarray, np.ndarray
+            master index of the parent (-1 for the root) and depth of each
+            node
+        """
+
+        parents = np.full(len(self.positions), -1)
+        parents[self.edges[:, 1]] = self.edges[:, 0]
+
+        # all nodes move to their ancestors at once until the root is reached
+        depths = np.zeros(len(self.positions), dtype=int)
+        ancestors = parents.copy()
+        has_ancestor = ancestors >= 0
+        while has_ancestor.any():
+            depths += has_ancestor
+            ancestors[has_ancestor] = parents[ancestors[has_ancestor]]
+            has_ancestor = ancestors >= 0
+
+        return parents, depths
+
+    def __aggregate_subtrees(self) -> (np.ndarray, np.ndarray):
+        """
+        Counts nodes in the subtree of each node and finds the most frequent
+        color (type of statement) in it.
+
+        Returns
+        -------
+        np.ndarray, np.ndarray
+            number of nodes and the most frequent color in the subtree of
+            each node
+        """
+
+        color_names, color_codes = np.unique(self.colors, return_inverse=True)
+        counts = np.zeros((len(self.positions), len(color_names)), dtype=int)
+        counts[np.arange(len(self.positions)), color_codes] = 1
+
+        # counts from the deepest nodes are added to their parents level by
+        # level
+        for depth in range(self.depths.max(), 0, -1):
+            nodes = np.flatnonzero(self.depths == depth)
+            np.add.at(counts, self.parents[nodes], counts[nodes])
+
+        return counts.sum(axis=1), color_names[counts.argmax(axis=1)]
+
+    def __visible_nodes(self, max_nodes: int,
+                        max_depth: int or None) -> (np.ndarray, np.ndarray):
+        """
+        Finds nodes which shall be displayed. Nodes up to the max_depth are
+        displayed and the subtrees of the nodes in max_depth are aggregated
+        into these nodes unless they're expanded.
+
+        Parameters
+        ----------
+        max_nodes : int
+            maximum number of the displayed nodes used to determine max_depth
+            if it's not given
+        max_depth : int or None
+            depth of the aggregated nodes
+
+        Returns
+        -------
+        np.ndarray, np.ndarray
+            boolean masks of the displayed nodes and of the aggregated nodes
+        """
+
+        if max_depth is None:
+            if len(self.positions) <= max_nodes:
+                max_depth = self.depths.max() + 1
+            else:
+                # the deepest level where all the nodes up to it fit in
+                # max_nodes, at least the nodes of depth 1 are displayed
+                counts = np.bincount(self.depths).cumsum()
+                max_depth = max(1, np.searchsorted(counts, max_nodes,
+                                                   side='right') - 1)
+
+        self.max_depth = max_depth
+        is_open = self.depths < max_depth
+        is_open[list(self.expanded)] = True
+
+        visible = np.zeros(len(self.positions), dtype=bool)
+        visible[0] = True
+        for depth in range(1, self.depths.max() + 1):
+            nodes = np.flatnonzero(self.depths == depth)
+            parents = self.parents[nodes]
+            visible[nodes] = visible[parents] & is_open[parents]
+
+        aggregated = visible & ~is_open & (self.subtree_sizes > 1)
+
+        return visible, aggregated
+
+    def expand(self, node: int) -> bool:
+        """
+        Expands the aggregated node from the last figure, so that its children
+        are displayed in the next figure.
+
+        Parameters
+        ----------
+        node : int
+            master index of the node
+
+        Returns
+        -------
+        bool
+            True if the node was aggregated and it's expanded now, False
+            otherwise
+        """
+
+        if (
+                self.max_depth is None
+                or node in self.expanded
+                or self.depths[node] < self.max_depth
+                or self.subtree_sizes[node] <= 1
+        ):
+            return False
+
+        self.expanded.add(node)
+        return True
+
+    def get_figure(self, horizontal=False, max_nodes=MAX_NODES,
+                   max_depth=None) -> go.Figure:
+        """
+        Returns a figure containing tree diagram representing the AST of
+        the source code. Large trees are displayed only up to some depth,
+        deeper subtrees are aggregated into nodes sized by the number of
+        nodes and colored by the most frequent type of statement in them.
+
+        Parameters
+        ----------
+        horizontal : bool, optional
+            determines, whether the tree should be oriented horizontally or
+            vertically (default is False)
+        max_nodes : int, optional
+            maximum number of nodes displayed without aggregation, it's
+            ignored if max_depth is set (default is MAX_NODES)
+        max_depth : int or None, optional
+            depth of the nodes whose subtrees are aggregated, if None it's
+            determined by max_nodes (default is None)
+
+        Returns
+        -------
+        go.Figure
+            go.Figure instance containing the tree diagram representing
+            the AST of the source code
+        """
+
+        # count node positions and switch original x and y coordinates so
+        # that tree would branch horizontally
+        max_y = self.positions[:, 1].max()
+        nodes_x = 2 * max_y - self.positions[:, 1]
+        nodes_y = self.positions[:, 0]
 
         if horizontal:
             # just swap axis x and y for horizontal display of the tree
-            nodes_x = [x for x in nodes_x]
-            nodes_y = [y for y in nodes_y]
             nodes_x, nodes_y = nodes_y, nodes_x
-            edges_x, edges_y = edges_y, edges_x
 
         else:
             # mirror the graph in both directions so that the edges
             # are oriented form left to right and nodes in order from
             # the smallest to the largest
-            nodes_x = [-x for x in nodes_x]
-            nodes_y = [-y for y in nodes_y]
-            edges_x = list(map(lambda x: -x if x else x, edges_x))
-            edges_y = list(map(lambda y: -y if y else y, edges_y))
+            nodes_x = -nodes_x
+            nodes_y = -nodes_y
+
+        visible, aggregated = self.__visible_nodes(max_nodes, max_depth)
+        edges = self.edges[visible[self.edges[:, 1]]]
+
+        # each edge is a line between its nodes followed by None, so that
+        # the edges aren't connected to each other
+        edges_x = np.full((len(edges), 3), None, dtype=object)
+        edges_y = np.full((len(edges), 3), None, dtype=object)
+        for i in range(2):
+            # adding 0 turns -0.0 of mirrored edges to 0.0
+            edges_x[:, i] = nodes_x[edges[:, i]] + 0.0
+            edges_y[:, i] = nodes_y[edges[:, i]] + 0.0
+
+        # aggregated nodes are larger according to the size of the subtree
+        colors = np.array(self.colors, dtype=object)
+        colors[aggregated] = self.dominant_colors[aggregated]
+        text = np.array(self.text, dtype=object)
+        sizes = self.subtree_sizes[aggregated]
+        text[aggregated] = ['{} +{} nodes'.format(t, size - 1)
+                            for t, size in zip(text[aggregated], sizes)]
+        if aggregated.any():
+            marker_size = np.full(len(self.positions), 10.0)
+            marker_size[aggregated] = np.minimum(10 + 2 * np.sqrt(sizes), 40)
+            marker_size = marker_size[visible]
+        else:
+            marker_size = 10
+
+        nodes = np.flatnonzero(visible)
+        scatter = go.Scattergl if len(nodes) > GL_NODES else go.Scatter
 
         fig = go.Figure()
 
         fig.add_trace(
-            go.Scatter(
-                x=edges_x,
-                y=edges_y,
+            scatter(
+                x=edges_x.ravel(),
+                y=edges_y.ravel(),
                 mode='lines',
                 line={
                     'width': 1,
@@ -188,19 +417,21 @@ class Tree:
         )
 
         fig.add_trace(
-            go.Scatter(
-                x=nodes_x,
-                y=nodes_y,
+            scatter(
+                x=nodes_x[nodes],
+                y=nodes_y[nodes],
+                # master index of the node for expanding after click
+                customdata=nodes,
                 mode='markers',
                 marker={
-                    'size': 10,
-                    'color': self.colors,
+                    'size': marker_size,
+                    'color': colors[nodes].tolist(),
                     'line': {
                         'width': 0.5,
                         'color': 'white'
                     }
                 },
-                text=self.text,
+                text=text[nodes].tolist(),
                 hoverinfo='text',
                 opacity=0.8
             )
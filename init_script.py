@@ -1,8 +1,12 @@
 """
 Simple script for processing training data and saving all their activations
-for later use.
+and their dimensionality reduction for later use.
 """
 
 from network.pipeline import save_train_data_activations
+from components.clusters import Clusters
 
 save_train_data_activations(output_dir='network/')
+# dimensionality reduction of the train data is computed and cached on
+# the first load
+Clusters()
@@ -0,0 +1,271 @@
+"""
+Background jobs for the slow parts of the visualization (placement of
+the analyzed sample among the clusters of the train data, visualization of
+the activations on all layers and the analysis of the compared train
+samples). Jobs run in a pool of worker processes, so the Dash requests stay
+responsive, the interface polls the state of the jobs by their ids.
+Job id is derived from the key of the job, so the same job submitted
+repeatedly (e.g. from multiple sessions) is computed just once.
+
+The components computed by the jobs are imported only in the worker
+processes, and the NN model is loaded by network.registry only when it's
+first needed, so the workers aren't forked with initialized TensorFlow.
+"""
+
+import sys
+import copy
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sample import Sample
+
+# number of the worker processes
+JOB_WORKERS = 2
+# time (in seconds) for which the results of the finished jobs are kept
+JOB_TTL = 10 * 60
+# interval (in milliseconds) in which the interface polls the jobs
+JOB_POLL_INTERVAL = 500
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+
+# runs the job in the worker process, the job reports its progress (from 0
+# to 1) to the shared dict
+def run_job(job_id: str, progress, function, *args):
+    def report(fraction: float):
+        progress[job_id] = fraction
+
+    report(0.0)
+    return function(*args, report=report)
+
+
+class JobQueue:
+    """
+    Queue of the jobs computed by the pool of worker processes.
+
+    Attributes
+    ----------
+    max_workers : int
+        number of the worker processes
+    ttl : int or float
+        time (in seconds) for which the results of the finished jobs are kept
+    jobs : dict
+        future, submission time and finish time of each job keyed by the job
+        id
+
+    Methods
+    -------
+    start()
+        Starts the worker processes.
+    submit(key, function, *args)
+        Submits the job unless the same job is already queued, running or
+        finished and returns its id.
+    status(job_id)
+        Returns state, progress and possibly the result of the job.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, ttl=JOB_TTL):
+        """
+        Parameters
+        ----------
+        max_workers : int, optional
+            number of the worker processes (default is JOB_WORKERS)
+        ttl : int or float, optional
+            time (in seconds) for which the results of the finished jobs are
+            kept (default is JOB_TTL)
+        """
+
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.jobs = dict()
+        self.__manager = None
+        self.__progress = None
+        self.__executor = None
+        self.__lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the worker processes. It should be called before the NN model
+        is loaded, so the workers are forked from the process without
+        the initialized model and load their own one when they need it.
+        The workers aren't started again when they crash, since they would
+        be forked from the process with the loaded model, the app has to be
+        restarted instead.
+        """
+
+        with self.__lock:
+            if self.__executor is not None:
+                return
+
+            log.debug('Starting {} job workers...'.format(self.max_workers))
+            if 'tensorflow' in sys.modules:
+                log.debug('TensorFlow is initialized before the job workers '
+                          'are forked, the workers may hang')
+            # worker processes are forked where possible, so they don't
+            # import the main module of the app again
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            else:
+                context = multiprocessing.get_context()
+
+            self.__manager = context.Manager()
+            self.__progress = self.__manager.dict()
+            self.__executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=context)
+            # forked workers are all started with the first job
+            self.__executor.submit(int).result()
+
+    def __sweep(self):
+        """
+        Removes finished jobs older than ttl. Has to be called with the lock
+        held.
+        """
+
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if not job['future'].done():
+                continue
+
+            if job['finished'] is None:
+                job['finished'] = now
+            elif now - job['finished'] > self.ttl:
+                del self.jobs[job_id]
+                self.__progress.pop(job_id, None)
+
+    def submit(self, key, function, *args) -> str:
+        """
+        Submits the job unless the same job is already queued, running or
+        finished successfully.
+
+        Parameters
+        ----------
+        key :
+            key identifying the job, e.g. kind of the job together with
+            the path and modification time of the JSON file
+        function :
+            module level function computing the result, it's called with
+            the arguments and keyword argument report, which is a function
+            accepting the progress of the job (from 0 to 1)
+        args :
+            picklable arguments of the function
+
+        Returns
+        -------
+        str
+            id of the job
+        """
+
+        job_id = hashlib.sha1(repr(key).encode()).hexdigest()
+        if self.__executor is None:
+            self.start()
+
+        with self.__lock:
+            self.__sweep()
+            job = self.jobs.get(job_id)
+            if job and not (job['future'].done()
+                            and job['future'].exception() is not None):
+                return job_id
+
+            self.__progress.pop(job_id, None)
+            try:
+                future = self.__executor.submit(
+                    run_job, job_id, self.__progress, function, *args)
+            except BrokenProcessPool as e:
+                log.debug('Job workers crashed, the app has to be restarted')
+                future = Future()
+                future.set_exception(e)
+
+            self.jobs[job_id] = {'future': future, 'submitted': time.time(),
+                                 'finished': None}
+
+        return job_id
+
+    def status(self, job_id: str) -> dict:
+        """
+        Returns state, progress and possibly the result of the job.
+
+        Parameters
+        ----------
+        job_id : str
+            id returned by submit
+
+        Returns
+        -------
+        dict
+            'state' of the job ('unknown', 'queued', 'running', 'done' or
+            'failed'), its 'progress' (from 0 to 1), 'result' of the finished
+            job and 'error' message of the failed job
+        """
+
+        with self.__lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return {'state': 'unknown', 'progress': 0.0}
+
+            future = job['future']
+            if not future.done():
+                progress = self.__progress.get(job_id)
+                if progress is None:
+                    return {'state': 'queued', 'progress': 0.0}
+                return {'state': 'running', 'progress': progress}
+
+        error = future.exception()
+        if error is not None:
+            log.debug('Job {} failed: {}'.format(job_id, error))
+            return {'state': 'failed', 'progress': 1.0, 'error': str(error)}
+
+        return {'state': 'done', 'progress': 1.0, 'result': future.result()}
+
+
+# places the analyzed sample among the train data in the cluster diagram,
+# returns the state of Clusters with the sample
+def cluster_job(sample: Sample, report) -> dict:
+    from components.clusters import get_clusters
+
+    # train data are loaded and the reductions are fitted (or loaded from
+    # the activation store) only by the first job of the worker and after
+    # the NN model is reloaded
+    clusters = copy.copy(get_clusters())
+    report(0.6)
+
+    clusters.set_state(None)
+    clusters.add_sample(sample)
+    report(0.9)
+
+    return clusters.get_state()
+
+
+# returns figure with the activations on all layers of the NN
+def network_job(sample: Sample, report) -> dict:
+    from components.network import Network
+
+    figure = Network(sample=sample).get_figure()
+    report(0.7)
+
+    return figure.to_dict()
+
+
+# analyzes the compared train sample, returns its Prediction visualization
+# and its SeeSoft (content 'code') or AST visualization
+def comparison_job(path: str, content: str, report) -> (dict, dict):
+    from analysis import get_analysis
+
+    # the analysis takes most of the job unless it's cached by the worker
+    analysis = get_analysis(path, report=lambda fraction: report(
+        0.8 * fraction))
+    report(0.8)
+
+    prediction = analysis.prediction.get_figure(small=True).to_dict()
+    report(0.9)
+    if content == 'code':
+        return prediction, analysis.seesoft_figure(small=True)
+
+    # AST of the analysis is shared, so it's not modified
+    return prediction, copy.copy(analysis.tree).get_figure().to_dict()
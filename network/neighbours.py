@@ -0,0 +1,102 @@
+"""
+Index of the train data activations for finding the train modules which are
+the most similar to the analyzed sample.
+"""
+
+import logging
+import numpy as np
+from typing import List, Tuple
+from network.store import load_activations
+
+# layer of NN whose activations are compared
+LAYER = 4
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+
+class NearestNeighbours:
+    """
+    Exact k-nearest neighbours index over the train data activations from
+    the activation store. Distances are computed by one matrix-vector product
+    over all the train modules, which takes milliseconds even for the whole
+    train data.
+
+    Attributes
+    ----------
+    data_paths : np.ndarray
+        JSON paths of the train modules, e.g. '30log/AST1.json'
+    activations : np.ndarray
+        float32 activations of the train modules, one row for each module
+    squared_norms : np.ndarray
+        squared euclidean norms of the rows of activations
+
+    Methods
+    -------
+    query(activations, k=5, exclude=None)
+        Returns JSON paths of k train modules with the closest activations
+        together with the distances.
+    """
+
+    def __init__(self, layer=LAYER):
+        """
+        Loads train data activations from the activation store, modules
+        without JSON file in the data directory are skipped.
+
+        Parameters
+        ----------
+        layer : int, optional
+            layer of NN whose activations are compared (default is LAYER)
+        """
+
+        log.debug('Building nearest neighbours index...')
+        meta, activations = load_activations(layer)
+        rows = (meta['data path'] != '').values
+
+        self.data_paths = meta['data path'].to_numpy()[rows]
+        self.activations = np.ascontiguousarray(
+            activations[rows].reshape(rows.sum(), -1), dtype=np.float32)
+        self.squared_norms = np.einsum('ij,ij->i', self.activations,
+                                       self.activations)
+
+    def query(self, activations, k=5, exclude=None) -> List[Tuple[str,
+                                                                  float]]:
+        """
+        Returns JSON paths of k train modules whose activations are
+        the closest (in euclidean distance) to the given activations.
+
+        Parameters
+        ----------
+        activations : np.ndarray
+            activations of the analyzed sample from the same layer as
+            the index was built for
+        k : int, optional
+            number of returned train modules (default is 5)
+        exclude : str or None, optional
+            JSON path which shall not be returned, e.g. the path of
+            the analyzed sample itself (default is None)
+
+        Returns
+        -------
+        list of tuple
+            JSON path and distance for each of the closest train modules,
+            sorted from the closest one
+        """
+
+        x = np.asarray(activations, dtype=np.float32).reshape(-1)
+        distances = self.squared_norms - 2 * (self.activations @ x) + x @ x
+        np.maximum(distances, 0, out=distances)
+
+        if exclude is not None:
+            distances[self.data_paths == exclude] = np.inf
+
+        k = min(k, len(distances))
+        if k <= 0:
+            return list()
+
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        return [(self.data_paths[i], float(np.sqrt(distances[i])))
+                for i in nearest if np.isfinite(distances[i])]
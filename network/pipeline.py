@@ -1,28 +1,31 @@
 """For more details see https://github.com/krockamichael/bachelor_thesis"""
 
 import os
-from constant import MODEL_NAME
 from preprocessing.module_handler import ModuleHandler
-from keras.models import load_model
-from keras.models import Model
 from network.utils import load_file
-from network.clustering import ClusteringLayer
+from network.registry import get_model
+from network.registry import get_activation_model
+from network.registry import get_layer_model
+from network.store import save_activations
 import numpy as np
 from typing import List
 import logging
-import csv
 import json
+import threading
 
 MAX_CONTEXTS = 430
 LAYERS_COUNT = 5
-here = os.path.dirname(os.path.realpath(__file__))
-model_path = '{}/{}'.format(here, MODEL_NAME)
+HASH_CACHE_SIZE = 2 ** 20
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 log.addHandler(logging.StreamHandler())
 
+# Java hash codes of node labels and paths, shared by the threads of the app
+hash_cache = dict()
+hash_cache_lock = threading.Lock()
+
 
 # imitating Java's String#hashCode as the model is trained on hashed paths
 def java_string_hashcode(s: str) -> int:
@@ -33,66 +36,62 @@ def java_string_hashcode(s: str) -> int:
     return ((h + 0x80000000) & 0xFFFFFFFF) - 0x80000000
 
 
-# module pre-processing, output can be used as input for NN
-def build_input_from_json(json_path: str) -> np.ndarray:
-    # get context paths
-    module_handler = ModuleHandler(json_path)
-    context_paths = module_handler.get_context_paths()
-
-    # trim number of context paths if they exceed MAX_CONTEXTS
-    while len(context_paths) > MAX_CONTEXTS * 2:
-        # get every second element --> halve list length, this is FAST
-        context_paths = context_paths[0::2]
-
-    excess_contexts = len(context_paths) - MAX_CONTEXTS
-    if excess_contexts > 0:
-        new_contexts = list()
-        for _, i in enumerate(context_paths):
-            if _ < 2 * excess_contexts:
-                if _ % 2 == 1:
-                    new_contexts.append(i)
-            else:
-                context_paths = (
-                    [x for x in context_paths if x not in new_contexts]
-                )
-                break
-
-    # code context paths using java hash string
-    file_context_paths = ''
-    for i in context_paths:
-        source_node = i[0][0] + '|' + i[0][1]
-        hashed_source_node = java_string_hashcode(source_node)
+# vectorized java_string_hashcode for a batch of strings, the hashes are
+# cached since the same node labels and paths recur across modules
+# the result is built from the hashes looked up or computed in this call,
+# so it doesn't depend on the cache being cleared meanwhile
+def java_string_hashcodes(strings: List[str]) -> np.ndarray:
+    with hash_cache_lock:
+        hashes = {s: hash_cache[s] for s in set(strings) if s in hash_cache}
+    unknown = [s for s in set(strings) if s not in hashes]
+
+    if unknown:
+        # code points of the strings, padded with zeros on the right
+        chars = np.array(unknown, dtype=str)
+        width = chars.dtype.itemsize // 4
+        codes = chars.view(np.uint32).reshape(len(unknown), width)
+        lengths = np.array([len(s) for s in unknown])
+
+        # uint32 arithmetic overflows in the same way as Java's int
+        h = np.zeros(len(unknown), dtype=np.uint32)
+        for j in range(width):
+            h = np.where(j < lengths, h * np.uint32(31) + codes[:, j], h)
 
-        path = ''.join(i[1])
-        hashed_path = java_string_hashcode(path)
+        computed = dict(zip(unknown, h.view(np.int32).tolist()))
+        hashes.update(computed)
 
-        target_node = i[2][0] + '|' + i[2][1]
-        hashed_target_node = java_string_hashcode(target_node)
+        with hash_cache_lock:
+            if len(hash_cache) + len(computed) > HASH_CACHE_SIZE:
+                hash_cache.clear()
+            hash_cache.update(computed)
 
-        file_context_paths += (str(hashed_source_node) + ',' + str(hashed_path)
-                               + ',' + str(hashed_target_node) + ' ')
+    return np.array([hashes[s] for s in strings], dtype=np.int32)
 
-    # do zero-padding
-    if len(context_paths) < 430:
-        for i in range(MAX_CONTEXTS - len(context_paths)):
-            file_context_paths += '0,0,0 '
 
-    # remove excess white-space at the end
-    if file_context_paths[-1] == ' ':
-        file_context_paths = file_context_paths[:-1]
+# module pre-processing, output can be used as input for NN
+def build_input_from_json(json_path: str) -> np.ndarray:
+    # get context paths, the number of context paths is trimmed to
+    # MAX_CONTEXTS already when they are built
+    module_handler = ModuleHandler(json_path)
+    context_paths = module_handler.get_context_paths(
+        max_contexts=MAX_CONTEXTS)
+
+    # code context paths using java hash string, hashes of the source node,
+    # path and target node are stored in consecutive order
+    strings = list()
+    for i in context_paths:
+        strings.append(i[0][0] + '|' + i[0][1])
+        strings.append(''.join(i[1]))
+        strings.append(i[2][0] + '|' + i[2][1])
 
     # generate dataset in the form of
     # (n_samples, n_context_paths, source_path_target)
-    # shape(18000, 430)
-    triplets = (
-        [file_context_paths.replace('"', '').replace('\n', '').split(" ")]
-    )
-    # shape (18000, 430, 3)
-    singles = []
-    for t in triplets:
-        singles += [[trp.split(',') for trp in t]]
-
-    data = np.ma.array(singles).astype(np.int32)
+    # shape (1, 430, 3), rows after the context paths stay zero-padded
+    data = np.zeros((1, max(MAX_CONTEXTS, len(context_paths)), 3),
+                    dtype=np.int32)
+    data[0, :len(context_paths)] = java_string_hashcodes(strings).reshape(
+        len(context_paths), 3)
+
     # values without zero-padding, to perform normalisation
     masked_data = np.ma.masked_equal(data, 0)
 
@@ -114,9 +113,8 @@ def module_pipeline(json_path: str) -> int:
     # load the data
     data = build_input_from_json(json_path)
 
-    # load model and generate label
-    model = load_model(model_path,
-                       custom_objects={'ClusteringLayer': ClusteringLayer})
+    # get loaded model and generate label
+    model = get_model()
 
     log.debug('Clustering model predicting...')
     x_model = model.predict(data)
@@ -128,8 +126,7 @@ def module_pipeline(json_path: str) -> int:
 
 # pipeline for predicting the whole dataset
 def dataset_pipeline() -> np.ndarray:
-    model = load_model(model_path,
-                       custom_objects={'ClusteringLayer': ClusteringLayer})
+    model = get_model()
 
     names, context_paths = load_file()
     train, validate, test = np.split(context_paths,
@@ -146,8 +143,7 @@ def dataset_pipeline() -> np.ndarray:
 # if the module is provided get activations for module, otherwise for
 # whole dataset
 def dataset_activations(layer=None) -> (List[str], dict):
-    model = load_model(model_path,
-                       custom_objects={'ClusteringLayer': ClusteringLayer})
+    model = get_model()
 
     names, context_paths = load_file()
     train, valid, test = np.split(context_paths,
@@ -160,25 +156,19 @@ def dataset_activations(layer=None) -> (List[str], dict):
     # if the layer number is chosen
     if layer and layer in range(LAYERS_COUNT):
         # choose output layer
-        encoder = Model(inputs=model.layers[0].input,
-                        outputs=model.layers[layer].output, name='encoder')
+        encoder = get_layer_model(model, layer)
 
         log.debug('Predicting output layer {}'.format(layer + 1))
         x_encoder_model = encoder.predict(train)
 
         return train_names, {layer: x_encoder_model}
 
-    # if the whole network should be tracked
-    layer_outputs = dict()
-    for i in range(LAYERS_COUNT):
-        # choose output layer
-        encoder = Model(inputs=model.layers[0].input,
-                        outputs=model.layers[i].output, name='encoder')
-
-        log.debug('Predicting output layer {}/{}'.format(i + 1, LAYERS_COUNT))
-        x_encoder_model = encoder.predict(train)
+    # if the whole network should be tracked, all layers are predicted
+    # in one forward pass
+    encoder = get_activation_model(model, LAYERS_COUNT)
 
-        layer_outputs[i] = x_encoder_model
+    log.debug('Predicting output layers 1-{}'.format(LAYERS_COUNT))
+    layer_outputs = dict(enumerate(encoder.predict(train)))
 
     return train_names, layer_outputs
 
@@ -189,43 +179,33 @@ def module_activations(json_path: str, model=None, layer=None) -> dict:
     # load the data
     data = build_input_from_json(json_path)
 
-    # load model and generate label
-    model = (model or
-             load_model(model_path, custom_objects={
-                                    'ClusteringLayer': ClusteringLayer})
-             )
+    # get loaded model and generate label
+    model = model or get_model()
 
     layers_count = len(model.layers)
 
     # if the layer number is chosen
     if layer and layer in range(layers_count):
         # choose output layer
-        encoder = Model(inputs=model.layers[0].input,
-                        outputs=model.layers[layer].output, name='encoder')
+        encoder = get_layer_model(model, layer)
 
         log.debug('Predicting output layer {}'.format(layer + 1))
         x_encoder_model = encoder.predict(data)
 
         return {layer: x_encoder_model}
 
-    # if the whole network should be tracked
-    layer_outputs = dict()
-    for i in range(layers_count):
-        # choose output layer
-        encoder = Model(inputs=model.layers[0].input,
-                        outputs=model.layers[i].output, name='encoder')
+    # if the whole network should be tracked, all layers are predicted
+    # in one forward pass
+    encoder = get_activation_model(model, layers_count)
 
-        log.debug('Predicting output layer {}/{}'.format(i + 1, layers_count))
-        x_encoder_model = encoder.predict(data)
-
-        layer_outputs[i] = x_encoder_model
+    log.debug('Predicting output layers 1-{}'.format(layers_count))
+    layer_outputs = dict(enumerate(encoder.predict(data)))
 
     return layer_outputs
 
 
-# create csv files containing following info for each module from train data:
-# module path, json path and activations from all layers
-# 1st dimension separated by space and 2nd dimension by '|'
+# save following info for each module from train data to activation store:
+# module path, json path, label and activations from all layers
 # activations from each layer are stored in separate files
 def save_train_data_activations(output_dir=None):
     path = os.path.dirname(os.path.realpath(__file__)) + '/../BP-data/data'
@@ -261,44 +241,7 @@ def save_train_data_activations(output_dir=None):
     labels = outputs[len(outputs) - 1]
     labels = labels.argmax(1)
 
-    rows_count = len(module_names)
-
-    # write line for each module from train data
-    # saves each layer to separate .csv file
-    for layer in outputs:
-        log.debug('Processing layer {}/{}'.format(layer + 1, len(outputs)))
-
-        csv_header = ['data path', 'module path', 'label',
-                      'layer{}'.format(layer)]
-
-        output_file = '{}train_data_activations_layer{}.csv'.format(
-            output_dir or '', layer)
-        with open(output_file, 'w', newline='') as file:
-            # write column names
-            writer = csv.writer(file)
-            writer.writerow(csv_header)
-
-            for i in range(rows_count):
-                csv_row = [data_names[i], module_names[i], labels[i]]
-
-                activations = outputs[layer][i]
-                final_activations = list()
-                shape = activations.shape
-                activations = activations.tolist()
-
-                # handle 1D layer
-                if len(shape) == 1:
-                    activations = map(str, activations)
-                    final_activations.append(' '.join(activations))
-
-                # handle 2D layer
-                elif len(shape) == 2:
-                    tmp_activations = list()
-                    for a in activations:
-                        a = map(str, a)
-                        tmp_activations.append(' '.join(a))
-
-                    final_activations.append('|'.join(tmp_activations))
-
-                csv_row.append(final_activations[0])
-                writer.writerow(csv_row)
+    # saves info about modules and activations from each layer to separate
+    # binary file
+    save_activations(data_names, module_names, labels, outputs,
+                     output_dir=output_dir)
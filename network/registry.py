@@ -0,0 +1,98 @@
+"""
+Registry of the trained NN models shared by the whole process. Each model
+is loaded and warmed up just once and reloaded only when its file changes.
+Keras is imported only when the first model is loaded, so the modules using
+the registry can be imported (e.g. by the tests or before the job workers are
+forked) without initializing TensorFlow.
+"""
+
+import os
+import logging
+import threading
+import numpy as np
+from constant import MODEL_NAME
+
+here = os.path.dirname(os.path.realpath(__file__))
+model_path = '{}/{}'.format(here, MODEL_NAME)
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+# loaded models together with the modification time of their files,
+# keyed by the path to the model file
+models = dict()
+# multi-output models returning activations from the first layers of
+# the loaded models, keyed by id of the model and number of layers
+activation_models = dict()
+lock = threading.Lock()
+
+
+# first prediction builds the predict function of the model, so it's done
+# right after loading instead of during the first request
+def warm_up(model):
+    input_shape = [dim or 1 for dim in model.input_shape]
+    model.predict(np.zeros(input_shape))
+
+
+# returns version of the model, which is the modification time of the model
+# file, results derived from the model (analyses, reductions) are keyed by
+# the version, so they aren't used anymore once the model is reloaded
+def model_version(path=None) -> float:
+    return os.path.getmtime(path or model_path)
+
+
+# returns loaded model, the model is loaded only the first time it's
+# requested or when the model file has been modified since
+def get_model(path=None):
+    path = path or model_path
+    modified = os.path.getmtime(path)
+
+    with lock:
+        if path not in models or models[path]['modified'] != modified:
+            log.debug('Loading model "{}"'.format(path))
+            if path in models:
+                forget_activation_models(models[path]['model'])
+
+            from keras.models import load_model
+            from network.clustering import ClusteringLayer
+            model = load_model(path, custom_objects={
+                'ClusteringLayer': ClusteringLayer})
+            warm_up(model)
+            models[path] = {'model': model, 'modified': modified}
+
+        return models[path]['model']
+
+
+# drops activation models built for the given (replaced) model
+def forget_activation_models(model):
+    for key in [k for k in activation_models if k[0] == id(model)]:
+        del activation_models[key]
+
+
+# returns model with outputs of the first layers_count layers of the given
+# model, so that activations of all layers are computed in one forward pass
+# instead of running the prediction separately for each layer
+def get_activation_model(model, layers_count: int):
+    key = (id(model), layers_count)
+
+    with lock:
+        if (
+                key not in activation_models
+                or activation_models[key]['model'] is not model
+        ):
+            from keras.models import Model
+            outputs = [model.layers[i].output for i in range(layers_count)]
+            activation_model = Model(inputs=model.layers[0].input,
+                                     outputs=outputs, name='encoder')
+            activation_models[key] = {'model': model,
+                                      'activation_model': activation_model}
+
+        return activation_models[key]['activation_model']
+
+
+# returns model with the output of the given layer of the given model
+def get_layer_model(model, layer: int):
+    from keras.models import Model
+    return Model(inputs=model.layers[0].input,
+                 outputs=model.layers[layer].output, name='encoder')
@@ -0,0 +1,106 @@
+"""
+Binary store of the train data activations. Activations from each layer are
+saved to separate .npy file, so that they can be memory-mapped without any
+parsing, and the info about modules (data path, module path and label) is
+saved to small .csv table. Results computed from the activations can be
+cached in the store as well, keyed by fingerprint of the activations.
+"""
+
+import os
+import logging
+import hashlib
+import fnmatch
+import pickle
+import numpy as np
+import pandas as pd
+from typing import List
+
+here = os.path.dirname(os.path.realpath(__file__))
+META_FILE = 'train_data_activations.csv'
+LAYER_FILE = 'train_data_activations_layer{}.npy'
+REDUCTIONS_FILE = 'train_data_reductions_{}.pkl'
+META_COLUMNS = ['data path', 'module path', 'label']
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+
+# saves info about modules and activations from all layers, the activations
+# are stored as float32
+def save_activations(data_names: List[str], module_names: List[str],
+                     labels: np.ndarray, outputs: dict, output_dir=None):
+    output_dir = output_dir or here
+
+    meta = pd.DataFrame({'data path': data_names,
+                         'module path': module_names,
+                         'label': labels})
+    meta.to_csv(os.path.join(output_dir, META_FILE), columns=META_COLUMNS,
+                index=False)
+
+    for layer in outputs:
+        log.debug('Saving layer {}/{}'.format(layer + 1, len(outputs)))
+        np.save(os.path.join(output_dir, LAYER_FILE.format(layer)),
+                np.asarray(outputs[layer], dtype=np.float32))
+
+
+# returns info about modules and memory-mapped activations from given layer,
+# i-th row of the activations belongs to the i-th module, modules which
+# don't have JSON file in the data directory have empty data path
+def load_activations(layer: int, input_dir=None) -> (pd.DataFrame,
+                                                     np.ndarray):
+    input_dir = input_dir or here
+
+    meta = pd.read_csv(os.path.join(input_dir, META_FILE),
+                       keep_default_na=False)
+    activations = np.load(os.path.join(input_dir, LAYER_FILE.format(layer)),
+                          mmap_mode='r')
+
+    return meta, activations
+
+
+# returns hash of the info about modules, activations from given layer and
+# the parameters, so that the results computed from the activations can be
+# cached and they are invalidated once the activations are saved again
+def fingerprint(layer: int, parameters: dict, input_dir=None) -> str:
+    input_dir = input_dir or here
+    sha = hashlib.sha1()
+
+    for file in [META_FILE, LAYER_FILE.format(layer)]:
+        with open(os.path.join(input_dir, file), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+
+    sha.update(repr(sorted(parameters.items())).encode())
+
+    return sha.hexdigest()
+
+
+# saves results of dimensionality reduction (fitted models and coordinates)
+# under given fingerprint, results saved under other fingerprints are removed
+def save_reductions(key: str, reductions: dict, output_dir=None):
+    output_dir = output_dir or here
+
+    for file in os.listdir(output_dir):
+        if fnmatch.fnmatch(file, REDUCTIONS_FILE.format('*')):
+            os.remove(os.path.join(output_dir, file))
+
+    with open(os.path.join(output_dir, REDUCTIONS_FILE.format(key)),
+              'wb') as f:
+        pickle.dump(reductions, f)
+
+
+# returns results of dimensionality reduction saved under given fingerprint
+# or None if there are no such results
+def load_reductions(key: str, input_dir=None) -> dict or None:
+    path = os.path.join(input_dir or here, REDUCTIONS_FILE.format(key))
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, AttributeError,
+            ImportError) as e:
+        log.debug('Cannot load "{}": {}'.format(path, e))
+        return None
@@ -18,6 +18,12 @@ class ModuleHandler:
                 self.data = json.load(f)
 
         self.tree = dict()
+        # parent and depth of each node, the tree is rooted only once so that
+        # the path between any 2 nodes can be found by walking up to their
+        # lowest common ancestor
+        self.parents = dict()
+        self.depths = dict()
+        self.__rooted = True
         self.__build_tree()
 
     '''
@@ -48,20 +54,33 @@ class ModuleHandler:
             if str(child['master_index']) in self.tree:
                 self.tree[str(child['master_index'])].append(
                     str(node['master_index']))
+                # node with more parents, AST is not a tree anymore
+                self.__rooted = False
             else:
                 self.tree[str(child['master_index'])] = list()
                 self.tree[str(child['master_index'])].append(
                     str(node['master_index']))
+                self.parents[str(child['master_index'])] = str(
+                    node['master_index'])
+                self.depths[str(child['master_index'])] = (
+                    self.depths[str(node['master_index'])] + 1)
             if 'children' in child:
                 self.__add_children_to_tree(child)
 
     def __build_tree(self):
         self.tree['0'] = list()
+        self.parents['0'] = None
+        self.depths['0'] = 0
 
         for node in self.data['nodes']:
+            if str(node['master_index']) in self.tree:
+                self.__rooted = False
+
             self.tree['0'].append(str(node['master_index']))
             # edge back to the root
             self.tree[str(node['master_index'])] = list('0')
+            self.parents[str(node['master_index'])] = '0'
+            self.depths[str(node['master_index'])] = 1
             if 'children' in node:
                 self.__add_children_to_tree(node)
 
@@ -120,8 +139,49 @@ class ModuleHandler:
 
         return pairs
 
-    # find path between 2 given terminals
-    def __find_path(self, start: str, end: str, visited=None) -> PATH or None:
+    # indices of terminal pairs (in the order given by itertools.combinations)
+    # which are kept when the list of all pairs is trimmed to max_contexts:
+    # the list is halved (every second pair is taken) while it's longer than
+    # 2 * max_contexts and then every odd pair from the first 2 * excess pairs
+    # is dropped, so only the kept pairs need to be enumerated
+    @staticmethod
+    def __sample_terminal_pairs(terminals_count: int,
+                                max_contexts: int) -> List[Tuple[int, int]]:
+        pairs_count = terminals_count * (terminals_count - 1) // 2
+
+        step = 1
+        count = pairs_count
+        while count > max_contexts * 2:
+            step *= 2
+            count = (count + 1) // 2
+
+        positions = range(count)
+        excess_contexts = count - max_contexts
+        # NOTE: when exactly 2 * max_contexts pairs are left, nothing is
+        # dropped, the original trimming behaves the same way
+        if 0 < excess_contexts and 2 * excess_contexts < count:
+            positions = [p for p in positions
+                         if p >= 2 * excess_contexts or p % 2 == 0]
+
+        # convert index of the pair to the indices of both terminals
+        pairs = list()
+        first = 0
+        row_start = 0
+        row_length = terminals_count - 1
+        for position in positions:
+            index = position * step
+            while index >= row_start + row_length:
+                row_start += row_length
+                row_length -= 1
+                first += 1
+            pairs.append((first, first + 1 + index - row_start))
+
+        return pairs
+
+    # find path between 2 given nodes using DFS over the whole tree
+    # used only when the AST can't be rooted (some node has more parents)
+    def __search_path(self, start: str, end: str,
+                      visited=None) -> PATH or None:
         if start == end:
             return [start]
 
@@ -130,12 +190,41 @@ class ModuleHandler:
             if node not in visited:
                 visited.add(node)
 
-                new_path = self.__find_path(node, end, visited)
+                new_path = self.__search_path(node, end, visited)
                 if new_path is not None:
                     return [start] + new_path
 
         return None
 
+    # find path between 2 given terminals by walking up from both of them
+    # to their lowest common ancestor, the cost is given by the path length
+    def __find_path(self, start: str, end: str) -> PATH or None:
+        if not self.__rooted:
+            return self.__search_path(start, end)
+
+        up = [start]
+        down = [end]
+        node_from = str(start)
+        node_to = str(end)
+
+        # get both nodes to the same depth
+        while self.depths[node_from] > self.depths[node_to]:
+            node_from = self.parents[node_from]
+            up.append(node_from)
+        while self.depths[node_to] > self.depths[node_from]:
+            node_to = self.parents[node_to]
+            down.append(node_to)
+
+        # walk up together until the common ancestor is reached
+        while node_from != node_to:
+            node_from = self.parents[node_from]
+            node_to = self.parents[node_to]
+            up.append(node_from)
+            down.append(node_to)
+
+        # common ancestor is the last node of both lists
+        return up + down[-2::-1]
+
     @staticmethod
     def __add_arrows(path: List[str]) -> PATH:
         path_with_arrows = list()
@@ -160,8 +249,19 @@ class ModuleHandler:
         return paths
 
     # all possible paths between terminals (leaves) without the actual leaves
-    def get_context_paths(self) -> List[PATH_CONTEXT]:
-        terminal_pairs = self.__get_terminal_pairs()
+    # if max_contexts is given, only the paths which are kept after trimming
+    # to max_contexts are built
+    def get_context_paths(self, max_contexts=None) -> List[PATH_CONTEXT]:
+        if max_contexts is not None:
+            terminals = self.get_terminals()
+            terminal_pairs = [
+                (terminals[i], terminals[j])
+                for i, j in self.__sample_terminal_pairs(len(terminals),
+                                                         max_contexts)
+            ]
+        else:
+            terminal_pairs = self.__get_terminal_pairs()
+
         context_paths = list()
         for pair in terminal_pairs:
             terminal_from = (str(pair[0][0]), str(pair[0][1]))
@@ -15,6 +15,8 @@ class Sample:
 
     Attributes
     ----------
+    path : str or None
+        path to the JSON file, None if the file was read from url
     data : dict
         content of JSON file which contains preprocessed data
     activations : dict
@@ -26,8 +28,8 @@ class Sample:
     def __init__(self, path=None, url=None, model=None):
         """
         Reads JSON file either from the provided path or url, therefore one of
-        these values has to be not None. If path to the NN model is provided,
-        then the model is loaded as well.
+        these values has to be not None. If the NN model is not provided,
+        the model shared by the whole process is used.
 
         Parameters
         ----------
@@ -37,13 +39,15 @@ class Sample:
         url : str or None, optional
             url of the JSON file which contains preprocessed LUA source code
             (default is None)
-        model : str or None, optional
-            path to the trained NN model (default is None)
+        model : keras.models.Model or None, optional
+            trained NN model, if None the model is taken from
+            network.registry (default is None)
         """
 
         if all(arg is None for arg in {path, url}):
             raise ValueError('Expected either path or url argument')
 
+        self.path = path
         if path:
             with open(path) as f:
                 self.data = json.load(f)
@@ -0,0 +1,310 @@
+"""
+Session-scoped state of the visualization tool. Every page load gets its own
+session id (kept in the browser in dcc.Store), the path of the submitted
+sample and the small state of the interface (expanded nodes of AST, click
+counter, state of the cluster diagram etc.) are then stored under this id, so
+multiple browser tabs don't overwrite each other's state. The analysis of
+the sample (Sample, LuaCode, AST etc.) isn't stored in the session, it's
+shared by all sessions through analysis.get_analysis. Sessions which weren't
+used for longer than their time to live are removed.
+
+The in-process backend is sufficient for a single (possibly threaded) server
+process, the filesystem backend shares the sessions between multiple worker
+processes of the WSGI server.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import logging
+import pickle
+import tempfile
+import threading
+
+# backend used by the app, 'memory' or 'filesystem'
+SESSION_BACKEND = 'memory'
+# directory of the filesystem backend
+SESSION_DIR = os.path.join(tempfile.gettempdir(), 'CodeNNVis-sessions')
+# time to live (in seconds) of the unused session
+SESSION_TTL = 2 * 60 * 60
+# minimal time (in seconds) between two searches for expired sessions
+SWEEP_INTERVAL = 60
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.DEBUG)
+log.addHandler(logging.StreamHandler())
+
+
+# returns new unique session id
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class MemoryBackend:
+    """
+    Session store keeping the values in the memory of the current process.
+
+    Attributes
+    ----------
+    ttl : int or float
+        time to live (in seconds) of the unused session
+    sessions : dict
+        values of each session keyed by the session id
+    accessed : dict
+        time of the last access to each session keyed by the session id
+
+    Methods
+    -------
+    get(session_id, key, default=None)
+        Returns value stored under the key in the session.
+    set(session_id, key, value)
+        Stores the value under the key in the session.
+    clear(session_id)
+        Removes all values of the session.
+    """
+
+    def __init__(self, ttl=SESSION_TTL):
+        """
+        Parameters
+        ----------
+        ttl : int or float, optional
+            time to live (in seconds) of the unused session (default is
+            SESSION_TTL)
+        """
+
+        self.ttl = ttl
+        self.sessions = dict()
+        self.accessed = dict()
+        self.__last_sweep = time.time()
+        self.__lock = threading.Lock()
+
+    def __touch(self, session_id: str) -> dict:
+        """
+        Returns values of the session and marks the session as used,
+        expired sessions are removed at most once per SWEEP_INTERVAL.
+        Has to be called with the lock held.
+        """
+
+        now = time.time()
+        if now - self.__last_sweep > SWEEP_INTERVAL:
+            self.__last_sweep = now
+            expired = [sid for sid, accessed in self.accessed.items()
+                       if now - accessed > self.ttl]
+            for sid in expired:
+                log.debug('Removing expired session {}'.format(sid))
+                del self.sessions[sid]
+                del self.accessed[sid]
+
+        self.accessed[session_id] = now
+        return self.sessions.setdefault(session_id, dict())
+
+    def get(self, session_id: str, key: str, default=None):
+        """
+        Returns value stored under the key in the session.
+
+        Parameters
+        ----------
+        session_id : str
+            id of the session
+        key : str
+            name of the value, e.g. 'sample'
+        default : optional
+            value returned if there's nothing stored under the key (default
+            is None)
+
+        Returns
+        -------
+        stored value or default
+        """
+
+        with self.__lock:
+            return self.__touch(session_id).get(key, default)
+
+    def set(self, session_id: str, key: str, value):
+        """
+        Stores the value under the key in the session.
+
+        Parameters
+        ----------
+        session_id : str
+            id of the session
+        key : str
+            name of the value, e.g. 'sample'
+        value :
+            stored value
+        """
+
+        with self.__lock:
+            self.__touch(session_id)[key] = value
+
+    def clear(self, session_id: str):
+        """
+        Removes all values of the session.
+
+        Parameters
+        ----------
+        session_id : str
+            id of the session
+        """
+
+        with self.__lock:
+            self.sessions.pop(session_id, None)
+            self.accessed.pop(session_id, None)
+
+
+class FileSystemBackend:
+    """
+    Session store keeping the values pickled in the directory shared by all
+    processes of the app. Each session has its own subdirectory with one file
+    for each value, modification time of the subdirectory is the time of
+    the last access to the session.
+
+    Attributes
+    ----------
+    directory : str
+        directory containing the sessions
+    ttl : int or float
+        time to live (in seconds) of the unused session
+
+    Methods
+    -------
+    get(session_id, key, default=None)
+        Returns value stored under the key in the session.
+    set(session_id, key, value)
+        Stores the value under the key in the session.
+    clear(session_id)
+        Removes all values of the session.
+    """
+
+    def __init__(self, directory=SESSION_DIR, ttl=SESSION_TTL):
+        """
+        Parameters
+        ----------
+        directory : str, optional
+            directory containing the sessions (default is SESSION_DIR)
+        ttl : int or float, optional
+            time to live (in seconds) of the unused session (default is
+            SESSION_TTL)
+        """
+
+        self.directory = directory
+        self.ttl = ttl
+        self.__last_sweep = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __session_dir(self, session_id: str) -> str:
+        # session id comes from the browser, so it can't point outside of
+        # the directory
+        if not session_id or not session_id.isalnum():
+            raise ValueError('Invalid session id {}'.format(session_id))
+
+        return os.path.join(self.directory, session_id)
+
+    def __sweep(self):
+        """
+        Removes sessions which weren't used for longer than ttl, at most once
+        per SWEEP_INTERVAL.
+        """
+
+        now = time.time()
+        if now - self.__last_sweep <= SWEEP_INTERVAL:
+            return
+
+        self.__last_sweep = now
+        for entry in os.scandir(self.directory):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    log.debug('Removing expired session {}'.format(
+                        entry.name))
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def __touch(self, session_id: str) -> str:
+        """
+        Returns directory of the session and marks the session as used.
+        """
+
+        self.__sweep()
+        session_dir = self.__session_dir(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        os.utime(session_dir)
+
+        return session_dir
+
+    def get(self, session_id: str, key: str, default=None):
+        """
+        Returns value stored under the key in the session.
+
+        Parameters
+        ----------
+        session_id : str
+            id of the session
+        key : str
+            name of the value, e.g. 'sample'
+        default : optional
+            value returned if there's nothing stored under the key (default
+            is None)
+
+        Returns
+        -------
+        stored value or default
+        """
+
+        path = os.path.join(self.__touch(session_id), '{}.pkl'.format(key))
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return default
+
+    def set(self, session_id: str, key: str, value):
+        """
+        Stores the value under the key in the session. The value is written
+        to a temporary file first, so the readers never see a partially
+        written value.
+
+        Parameters
+        ----------
+        session_id : str
+            id of the session
+        key : str
+            name of the value, e.g. 'sample'
+        value :
+            stored picklable value
+        """
+
+        session_dir = self.__touch(session_id)
+        fd, tmp_path = tempfile.mkstemp(dir=session_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, os.path.join(session_dir,
+                                              '{}.pkl'.format(key)))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def clear(self, session_id: str):
+        """
+        Removes all values of the session.
+
+        Parameters
+        ----------
+        session_id : str
+            id of the session
+        """
+
+        shutil.rmtree(self.__session_dir(session_id), ignore_errors=True)
+
+
+# returns session store with the given backend
+def create_store(backend=SESSION_BACKEND):
+    if backend == 'memory':
+        return MemoryBackend()
+
+    if backend == 'filesystem':
+        return FileSystemBackend()
+
+    raise ValueError('Unknown session backend {}'.format(backend))
@@ -0,0 +1,233 @@
+"""
+Tests of the vectorized Java String#hashCode used for coding the context
+paths, the hashes have to be the same as the ones computed string by string,
+and of the NN input built from the context paths, which has to be the same as
+the one built by the original string based implementation.
+"""
+
+import glob
+import json
+import random
+import threading
+import numpy as np
+import pytest
+import network.pipeline as pipeline
+from network.pipeline import java_string_hashcode
+from network.pipeline import java_string_hashcodes
+from network.pipeline import build_input_from_json
+from preprocessing.module_handler import ModuleHandler
+
+DATA_DIR = 'BP-data/data'
+# number of the JSON files from the data directory which are tested
+DATA_FILES = 50
+
+
+@pytest.fixture(autouse=True)
+def empty_hash_cache():
+    pipeline.hash_cache.clear()
+    yield
+    pipeline.hash_cache.clear()
+
+
+def random_strings(count: int, alphabet: str, seed=0) -> list:
+    rng = random.Random(seed)
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+            for _ in range(count)]
+
+
+def assert_same_hashes(strings: list):
+    expected = [java_string_hashcode(s) for s in strings]
+    assert java_string_hashcodes(strings).tolist() == expected
+    # the second call is answered from the cache
+    assert java_string_hashcodes(strings).tolist() == expected
+
+
+def test_ascii_strings():
+    alphabet = ('abcdefghijklmnopqrstuvwxyz'
+                'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789|_')
+    assert_same_hashes(random_strings(1000, alphabet))
+
+
+def test_unicode_strings():
+    alphabet = 'aZ|é€ßžщ中文😀\t\n\x00'
+    assert_same_hashes(random_strings(1000, alphabet, seed=1))
+
+
+def test_edge_cases():
+    assert_same_hashes(['', 'a', 'a' * 1000, '￿' * 7, 'a', ''])
+
+
+def test_cache_cleared_between_calls(monkeypatch):
+    monkeypatch.setattr(pipeline, 'HASH_CACHE_SIZE', 4)
+    assert_same_hashes(['a', 'b', 'c'])
+    # the cache overflows, strings cached by the first call are requested
+    # together with the new ones
+    assert_same_hashes(['a', 'd', 'e', 'f'])
+    assert len(pipeline.hash_cache) <= 4
+
+
+def test_threads(monkeypatch):
+    monkeypatch.setattr(pipeline, 'HASH_CACHE_SIZE', 64)
+    alphabet = 'abcdef|'
+    errors = list()
+
+    def run(seed: int):
+        try:
+            for i in range(20):
+                assert_same_hashes(random_strings(50, alphabet,
+                                                  seed=seed * 100 + i))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, )) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+
+
+def test_data_context_paths():
+    paths = sorted(glob.glob('{}/**/*.json'.format(DATA_DIR),
+                             recursive=True))[:DATA_FILES]
+    if not paths:
+        pytest.skip('No JSON files in {}'.format(DATA_DIR))
+
+    for path in paths:
+        context_paths = ModuleHandler(path).get_context_paths(
+            max_contexts=pipeline.MAX_CONTEXTS)
+        strings = list()
+        for i in context_paths:
+            strings.append(i[0][0] + '|' + i[0][1])
+            strings.append(''.join(i[1]))
+            strings.append(i[2][0] + '|' + i[2][1])
+
+        assert_same_hashes(strings)
+
+
+# original implementation of build_input_from_json, all context paths are
+# built and trimmed afterwards and the hashes are coded into the string which
+# is parsed to the masked array
+def legacy_build_input_from_json(json_path: str) -> np.ndarray:
+    max_contexts = pipeline.MAX_CONTEXTS
+    context_paths = ModuleHandler(json_path).get_context_paths()
+
+    while len(context_paths) > max_contexts * 2:
+        context_paths = context_paths[0::2]
+
+    excess_contexts = len(context_paths) - max_contexts
+    if excess_contexts > 0:
+        new_contexts = list()
+        for _, i in enumerate(context_paths):
+            if _ < 2 * excess_contexts:
+                if _ % 2 == 1:
+                    new_contexts.append(i)
+            else:
+                context_paths = (
+                    [x for x in context_paths if x not in new_contexts]
+                )
+                break
+
+    file_context_paths = ''
+    for i in context_paths:
+        hashed_source_node = java_string_hashcode(i[0][0] + '|' + i[0][1])
+        hashed_path = java_string_hashcode(''.join(i[1]))
+        hashed_target_node = java_string_hashcode(i[2][0] + '|' + i[2][1])
+        file_context_paths += (str(hashed_source_node) + ',' + str(hashed_path)
+                               + ',' + str(hashed_target_node) + ' ')
+
+    if len(context_paths) < 430:
+        for i in range(max_contexts - len(context_paths)):
+            file_context_paths += '0,0,0 '
+
+    if file_context_paths[-1] == ' ':
+        file_context_paths = file_context_paths[:-1]
+
+    triplets = (
+        [file_context_paths.replace('"', '').replace('\n', '').split(" ")]
+    )
+    singles = []
+    for t in triplets:
+        singles += [[trp.split(',') for trp in t]]
+
+    data = np.ma.array(singles).astype(np.int32)
+    masked_data = np.ma.masked_equal(data, 0)
+    normalised_masked_data = ((masked_data - 21.11153407758736)
+                              / 1157761522.5453846)
+
+    return normalised_masked_data.filled(0)
+
+
+# writes JSON file with AST of the given number of terminals, the terminals
+# are randomly nested in the inner nodes unless the AST should be flat
+def write_ast(path: str, terminals: int, flat=False, seed=0) -> str:
+    rng = random.Random(seed)
+    containers = ['require', 'variable', 'function', 'interface', 'other']
+    index = 0
+
+    def new_node() -> dict:
+        nonlocal index
+        index += 1
+        return {'master_index': index, 'container': rng.choice(containers)}
+
+    nodes = [new_node() for _ in range(terminals)]
+    while not flat and len(nodes) > 2 and rng.random() < 0.9:
+        start = rng.randrange(len(nodes) - 1)
+        end = rng.randint(start + 1, min(len(nodes), start + 4))
+        parent = new_node()
+        parent['children'] = nodes[start:end]
+        nodes[start:end] = [parent]
+
+    with open(path, 'w') as f:
+        json.dump({'path': None, 'url': None, 'nodes': nodes,
+                   'nodes_count': index}, f)
+
+    return path
+
+
+def assert_same_input(json_path: str, rows: int):
+    expected = legacy_build_input_from_json(json_path)
+    data = build_input_from_json(json_path)
+
+    assert data.shape == (1, rows, 3)
+    assert data.dtype == expected.dtype
+    assert np.array_equal(data, expected)
+
+
+# number of the terminals of the flat AST and number of the rows of the input
+# (C(t, 2) context paths halved while there are more than 2 * MAX_CONTEXTS of
+# them and trimmed to MAX_CONTEXTS unless exactly 2 * MAX_CONTEXTS are left)
+@pytest.mark.parametrize('terminals, rows', [
+    (0, 430),  # no context paths, only zero-padding
+    (1, 430),  # the root is a terminal too, so there is 1 context path
+    (2, 430),
+    (29, 430),  # 406 context paths
+    (30, 430),  # 435 context paths trimmed to 430
+    (42, 430),  # 861 context paths halved to 431 and trimmed to 430
+    (235, 860),  # 27495 context paths halved 5 times to 860, not trimmed
+])
+def test_flat_ast_input(tmp_path, terminals, rows):
+    json_path = write_ast(str(tmp_path / 'ast.json'), terminals, flat=True)
+    assert_same_input(json_path, rows)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_nested_ast_input(tmp_path, seed):
+    terminals = random.Random(seed).randint(20, 60)
+    json_path = write_ast(str(tmp_path / 'ast.json'), terminals, seed=seed)
+    rows = len(ModuleHandler(json_path).get_context_paths(
+        max_contexts=pipeline.MAX_CONTEXTS))
+    assert_same_input(json_path, max(rows, pipeline.MAX_CONTEXTS))
+
+
+def test_data_input():
+    paths = sorted(glob.glob('{}/**/*.json'.format(DATA_DIR),
+                             recursive=True))[:DATA_FILES]
+    if not paths:
+        pytest.skip('No JSON files in {}'.format(DATA_DIR))
+
+    for path in paths:
+        rows = len(ModuleHandler(path).get_context_paths(
+            max_contexts=pipeline.MAX_CONTEXTS))
+        assert_same_input(path, max(rows, pipeline.MAX_CONTEXTS))